@@ -0,0 +1,213 @@
+import os
+import sys
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from telethon.tl.types import (
+    Document, InputDocument, InputMediaDocument, InputMediaPhoto, InputPhoto,
+    MessageMediaDocument, MessageMediaPhoto, Photo,
+)
+
+# Total size the anti-delete cache may use across all users, in bytes (estimated)
+ANTIDELETE_CACHE_BYTES = int(os.getenv("ANTIDELETE_CACHE_BYTES", str(64 * 1024 * 1024)))
+# Most messages kept for one chat of one user; older ones are dropped first
+ANTIDELETE_CHAT_MAX = int(os.getenv("ANTIDELETE_CHAT_MAX", "2000"))
+# How long a message stays recoverable, in seconds
+ANTIDELETE_TTL = int(os.getenv("ANTIDELETE_TTL", "86400"))
+# Width of one timing-wheel slot, in seconds
+ANTIDELETE_WHEEL_TICK = int(os.getenv("ANTIDELETE_WHEEL_TICK", "60"))
+
+
+def media_ref(media):
+    """``(kind, id, access_hash, file_reference)`` of a photo or document, else None."""
+    if isinstance(media, MessageMediaPhoto) and isinstance(media.photo, Photo):
+        item = media.photo
+        return ("photo", item.id, item.access_hash, item.file_reference)
+    if isinstance(media, MessageMediaDocument) and isinstance(media.document, Document):
+        item = media.document
+        return ("document", item.id, item.access_hash, item.file_reference)
+    return None
+
+
+class CachedMessage:
+    """What the anti-delete log needs from a message, without the Telethon objects.
+
+    ``sender_name`` is None when the update didn't carry the sender; it is
+    looked up only if the message gets deleted. ``media`` is a ``media_ref``
+    tuple, turned back into sendable media by ``input_media``.
+    """
+
+    __slots__ = ("sender_id", "sender_name", "text", "date", "media")
+
+    def __init__(self, sender_id, sender_name, text, date, media=None):
+        self.sender_id = sender_id
+        self.sender_name = sys.intern(sender_name) if sender_name else None
+        self.text = text
+        self.date = date
+        self.media = media
+
+    @classmethod
+    def from_event(cls, event):
+        message = event.message
+        sender = event.sender
+        name = getattr(sender, "first_name", None) or getattr(sender, "title", None)
+        return cls(event.sender_id, name, message.message, int(message.date.timestamp()), media_ref(message.media))
+
+    @property
+    def time_str(self):
+        return datetime.fromtimestamp(self.date, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+    def input_media(self):
+        if self.media is None:
+            return None
+        kind, media_id, access_hash, file_reference = self.media
+        if kind == "photo":
+            return InputMediaPhoto(InputPhoto(media_id, access_hash, file_reference))
+        return InputMediaDocument(InputDocument(media_id, access_hash, file_reference))
+
+
+def estimate_size(entry):
+    """Rough bytes held by a cached entry: slots, text and media reference."""
+    size = 120 + (len(entry.text) if entry.text else 0)
+    if entry.media is not None:
+        size += 100 + len(entry.media[3])
+    return size
+
+
+class MessageCache:
+    """Messages kept so they can be shown after they are deleted.
+
+    Keys are (user_id, chat_id, msg_id). Memory is bounded three ways: a global
+    byte budget and a per-chat count, both enforced by evicting the oldest
+    entries first, and a TTL. Expiry uses a hashed timing wheel: each
+    entry is filed under the slot of its expiry tick, and every put/pop clears
+    only the slots that have come due since the last call, so there is never a
+    whole-cache sweep.
+    """
+
+    def __init__(self, max_bytes=ANTIDELETE_CACHE_BYTES, chat_max=ANTIDELETE_CHAT_MAX,
+                 ttl=ANTIDELETE_TTL, tick=ANTIDELETE_WHEEL_TICK, sizeof=estimate_size):
+        self.max_bytes = max_bytes
+        self.chat_max = chat_max
+        self.ttl = ttl
+        self.tick = max(1, tick)
+        self.sizeof = sizeof
+        # key -> (entry, size, expires_at, wheel slot), oldest first
+        self._entries = OrderedDict()
+        # (user_id, chat_id) -> msg ids of that chat, oldest first
+        self._chats = {}
+        # (user_id, msg_id) -> key, for deletions that don't say which chat (private chats, basic groups)
+        self._by_msg = {}
+        self._wheel = [set() for _ in range(ttl // self.tick + 2)]
+        # Last wheel tick whose slot has been cleared
+        self._last_tick = int(time.time()) // self.tick - 1
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def put(self, user_id, chat_id, msg_id, entry, indexed=True):
+        """Cache ``entry``; ``indexed`` lets ``pop_message`` find it without a chat id."""
+        now = time.time()
+        self._advance(now)
+        key = (user_id, chat_id, msg_id)
+        if key in self._entries:
+            self._remove(key)
+        size = self.sizeof(entry)
+        expires_at = now + self.ttl
+        slot = int(expires_at) // self.tick % len(self._wheel)
+        self._entries[key] = (entry, size, expires_at, slot)
+        self.bytes += size
+        chat = self._chats.get((user_id, chat_id))
+        if chat is None:
+            chat = self._chats[(user_id, chat_id)] = OrderedDict()
+        chat[msg_id] = None
+        if indexed:
+            self._by_msg[(user_id, msg_id)] = key
+        self._wheel[slot].add(key)
+
+        if len(chat) > self.chat_max:
+            self._remove((user_id, chat_id, next(iter(chat))))
+            self.evictions += 1
+        while self.bytes > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def pop(self, user_id, chat_id, msg_id):
+        """Remove and return the cached entry, or None."""
+        self._advance(time.time())
+        key = (user_id, chat_id, msg_id)
+        if key not in self._entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self._remove(key)
+
+    def pop_message(self, user_id, msg_id):
+        """Like ``pop`` for deletions that only carry the message id."""
+        self._advance(time.time())
+        key = self._by_msg.get((user_id, msg_id))
+        if key is None or key not in self._entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self._remove(key)
+
+    def drop_user(self, user_id):
+        for key in [key for key in self._entries if key[0] == user_id]:
+            self._remove(key)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "messages": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def _remove(self, key):
+        entry, size, _, slot = self._entries.pop(key)
+        self.bytes -= size
+        self._wheel[slot].discard(key)
+        chat = self._chats[key[:2]]
+        del chat[key[2]]
+        if not chat:
+            del self._chats[key[:2]]
+        index_key = (key[0], key[2])
+        if self._by_msg.get(index_key) == key:
+            del self._by_msg[index_key]
+        return entry
+
+    def _advance(self, now):
+        # Clear the slots of every tick that has fully elapsed since the last call
+        current = int(now) // self.tick
+        if current - 1 <= self._last_tick:
+            return
+        # A gap longer than the wheel only needs one pass over every slot
+        first = max(self._last_tick + 1, current - len(self._wheel))
+        for tick in range(first, current):
+            index = tick % len(self._wheel)
+            slot = self._wheel[index]
+            if not slot:
+                continue
+            # Entries a revolution or more away share the slot and go back into it
+            self._wheel[index] = keep = set()
+            for key in slot:
+                if self._entries[key][2] <= now:
+                    self._remove(key)
+                    self.expirations += 1
+                else:
+                    keep.add(key)
+        self._last_tick = current - 1
+
+message_cache = MessageCache()
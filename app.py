@@ -3,7 +3,6 @@ import os
 from dotenv import load_dotenv
 import logging
 import asyncio
-from telethon import TelegramClient
 from telethon.errors import SessionPasswordNeededError
 import json
 import re
@@ -15,6 +14,8 @@ from telethon.tl.functions.photos import UploadProfilePhotoRequest
 from telethon.tl.functions.account import UpdateUsernameRequest
 import requests
 from bs4 import BeautifulSoup
+from config_store import store
+from sessions import session_manager
 
 # Configure logging
 logging.basicConfig(
@@ -31,14 +32,9 @@ app.config['SECRET_KEY'] = os.getenv('FLASK_SECRET_KEY', os.urandom(24))
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 ADMIN_IDS = [int(id.strip()) for id in os.getenv('ADMIN_IDS', '').split(',') if id.strip()]
 
-# Create a function to run async code in Flask
+# Run async code from Flask on the bot's event loop, where the shared Telegram clients live
 def run_async(coro):
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        return loop.run_until_complete(coro)
-    finally:
-        loop.close()
+    return session_manager.run_sync(coro)
 
 def get_fragment_auction_details(username):
     """Fetch auction details from Fragment.com"""
@@ -157,12 +153,7 @@ def submit_phone():
     
     # Load user data to get API credentials
     try:
-        with open("config.json", "r") as f:
-            data = json.load(f)
-        
-        print(f"Config loaded successfully")
-
-        user_data = data["users"].get(user_id, {})
+        user_data = store.get_user(user_id)
         api_id = user_data.get("api_id")
         api_hash = user_data.get("api_hash")
         
@@ -180,19 +171,10 @@ def submit_phone():
             message = "You are already logged in with auto-reply enabled"
                 
         # Check if session exists
-        session_file = f'{user_id}.session'
-        if os.path.exists(session_file):
+        if session_manager.has_session(user_id):
             # Verify if the session is valid
             async def check_session():
-                client = TelegramClient(session_file, api_id, api_hash)
-                await client.connect()
-                
-                if await client.is_user_authorized():
-                    await client.disconnect()
-                    return True
-                
-                await client.disconnect()
-                return False
+                return await session_manager.is_authorized(user_id)
             
             is_authorized = run_async(check_session())
             if is_authorized:
@@ -216,21 +198,16 @@ def submit_phone():
         
         # Create a new Telethon client and send code request
         async def send_code():
-            # Create sessions directory if it doesn't exist
-            os.makedirs('sessions', exist_ok=True)
-            
-            client = TelegramClient(f'sessions/{user_id}.session', api_id, api_hash)
-            await client.connect()
+            # The user's shared client (backed by the session vault) carries the login through
+            client = await session_manager.get_client(user_id, require_session=False)
             
             # Send the code request
             sent_code = await client.send_code_request(phone)
-            session['phone_code_hash'] = sent_code.phone_code_hash
-            
-            await client.disconnect()
-            return True
+            return sent_code.phone_code_hash
         
-        success = run_async(send_code())
-        if success:
+        phone_code_hash = run_async(send_code())
+        if phone_code_hash:
+            session['phone_code_hash'] = phone_code_hash
             return jsonify({'success': True, 'phone': phone})
         else:
             return jsonify({'success': False, 'message': 'Failed to send verification code'})
@@ -258,25 +235,16 @@ def submit_otp():
     
     async def verify_code():
         try:
-            # Create a new Telethon client
-            client = TelegramClient(f'sessions/{user_id}.session', api_id, api_hash)
-            await client.connect()
+            client = await session_manager.get_client(user_id, require_session=False)
             
             try:
                 # Try to sign in with the code
                 await client.sign_in(phone=phone, code=otp, phone_code_hash=phone_code_hash)
-                await client.disconnect()
-                
-                # Copy the session file to the main directory
-                import shutil
-                source_path = f'sessions/{user_id}.session'
-                target_path = f'{user_id}.session'
-                shutil.copy2(source_path, target_path)
+                session_manager.mark_authorized(user_id)
                 
                 return {'success': True, 'needs_2fa': False}
                 
             except SessionPasswordNeededError:
-                await client.disconnect()
                 return {'success': True, 'needs_2fa': True}
                 
         except Exception as e:
@@ -303,19 +271,11 @@ def submit_2fa():
     
     async def verify_2fa():
         try:
-            # Create a new Telethon client
-            client = TelegramClient(f'sessions/{user_id}.session', api_id, api_hash)
-            await client.connect()
+            client = await session_manager.get_client(user_id, require_session=False)
             
             # Sign in with 2FA password
             await client.sign_in(password=password)
-            await client.disconnect()
-            
-            # Copy the session file to the main directory
-            import shutil
-            source_path = f'sessions/{user_id}.session'
-            target_path = f'{user_id}.session'
-            shutil.copy2(source_path, target_path)
+            session_manager.mark_authorized(user_id)
             
             return {'success': True}
             
@@ -338,28 +298,8 @@ def save_api_credentials():
         if not all([api_id, api_hash, user_id]):
             return jsonify({'success': False, 'message': 'API ID, API Hash, and User ID are required'})
         
-        # Load config file
-        try:
-            with open("config.json", "r") as f:
-                config_data = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            config_data = {"users": {}}
-        
-        # Ensure users dict exists
-        if "users" not in config_data:
-            config_data["users"] = {}
-        
-        # Ensure user exists in config
-        if user_id not in config_data["users"]:
-            config_data["users"][user_id] = {}
-        
         # Update API credentials
-        config_data["users"][user_id]["api_id"] = api_id
-        config_data["users"][user_id]["api_hash"] = api_hash
-        
-        # Save updated config
-        with open("config.json", "w") as f:
-            json.dump(config_data, f, indent=4)
+        store.submit(user_id, lambda record: record.update(api_id=api_id, api_hash=api_hash))
         
         return jsonify({'success': True, 'message': 'API credentials saved successfully'})
         
@@ -389,28 +329,17 @@ def username_checker():
 def get_usage_info(user_id):
     """Get current usage count and reset time for user"""
     try:
-        with open("config.json", "r") as f:
-            data = json.load(f)
-        
-        user_data = data["users"].get(user_id, {})
-        
         # Get today's date
         today = datetime.now().strftime("%Y-%m-%d")
         
-        # Initialize usage tracking if not exists
-        if "username_usage" not in user_data:
-            user_data["username_usage"] = {"date": today, "count": 0}
+        usage = store.get_user(user_id).get("username_usage")
         
         # Reset count if it's a new day
-        if user_data["username_usage"]["date"] != today:
-            user_data["username_usage"] = {"date": today, "count": 0}
-            
-            # Save updated data
-            data["users"][user_id] = user_data
-            with open("config.json", "w") as f:
-                json.dump(data, f, indent=4)
+        if usage and usage["date"] != today:
+            usage = {"date": today, "count": 0}
+            store.submit(user_id, lambda record: _reset_usage(record, today))
         
-        usage_count = user_data["username_usage"]["count"]
+        usage_count = usage["count"] if usage else 0
         
         # Calculate reset time (next day at midnight)
         tomorrow = datetime.now() + timedelta(days=1)
@@ -428,28 +357,24 @@ def get_usage_info(user_id):
         logger.error(f"Error getting usage info: {e}")
         return 0, "24h 0m"
 
+def _reset_usage(record, today):
+    if record.get("username_usage", {}).get("date") != today:
+        record["username_usage"] = {"date": today, "count": 0}
+
+def _increment_usage(record, today):
+    _reset_usage(record, today)
+    record["username_usage"]["count"] += 1
+
 def increment_usage_count(user_id):
     """Increment usage count for user"""
     try:
-        with open("config.json", "r") as f:
-            data = json.load(f)
-        
-        user_data = data["users"].get(user_id, {})
         today = datetime.now().strftime("%Y-%m-%d")
         
-        if "username_usage" not in user_data:
-            user_data["username_usage"] = {"date": today, "count": 0}
-        
-        if user_data["username_usage"]["date"] != today:
-            user_data["username_usage"] = {"date": today, "count": 0}
-        
-        user_data["username_usage"]["count"] += 1
-        
-        data["users"][user_id] = user_data
-        with open("config.json", "w") as f:
-            json.dump(data, f, indent=4)
+        usage = store.get_user(user_id).get("username_usage")
+        count = (usage["count"] if usage and usage["date"] == today else 0) + 1
+        store.submit(user_id, lambda record: _increment_usage(record, today))
             
-        return user_data["username_usage"]["count"]
+        return count
         
     except Exception as e:
         logger.error(f"Error incrementing usage count: {e}")
@@ -694,13 +619,7 @@ def check_username():
             return jsonify({'success': False, 'message': 'Invalid username format. Must be 4-32 characters, letters, numbers, and underscores only.'})
         
         # Check if user exists in config
-        try:
-            with open("config.json", "r") as f:
-                config_data = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return jsonify({'success': False, 'message': 'User not found in system'})
-        
-        user_data = config_data["users"].get(user_id, {})
+        user_data = store.get_user(user_id)
         if not user_data:
             return jsonify({'success': False, 'message': 'User not found in system'})
         
@@ -721,8 +640,7 @@ def check_username():
             return jsonify({'success': False, 'message': 'API credentials not found. Please set them first.'})
         
         # Check if session exists
-        session_file = f'{user_id}.session'
-        if not os.path.exists(session_file):
+        if not session_manager.has_session(user_id):
             return jsonify({
                 'success': False, 
                 'redirect': True,
@@ -733,15 +651,7 @@ def check_username():
         # Verify session is valid before proceeding
         async def verify_session():
             try:
-                client = TelegramClient(session_file, api_id, api_hash)
-                await client.connect()
-                
-                if not await client.is_user_authorized():
-                    await client.disconnect()
-                    return False
-                
-                await client.disconnect()
-                return True
+                return await session_manager.is_authorized(user_id, force=True)
                 
             except Exception as e:
                 logger.error(f"Error verifying session: {e}")
@@ -760,20 +670,16 @@ def check_username():
         # Check username availability
         async def check_availability():
             try:
-                client = TelegramClient(session_file, api_id, api_hash)
-                await client.connect()
+                client = await session_manager.get_client(user_id)
                 
                 if not await client.is_user_authorized():
-                    await client.disconnect()
                     return {'success': False, 'message': 'Session expired. Please login again.'}
                 
                 try:
                     # Try to get entity with the username
                     entity = await client.get_entity(username)
-                    await client.disconnect()
                     return {'available': False}  # Username is taken
                 except (UsernameNotOccupiedError, ValueError) as e:
-                    await client.disconnect()
                     
                     # Check if this is the specific error indicating Fragment auction
                     error_msg = str(e)
@@ -789,7 +695,6 @@ def check_username():
                     else:
                         return {'available': True}  # Username is available
                 except Exception as e:
-                    await client.disconnect()
                     logger.error(f"Error checking username: {e}")
                     
                     # Check if this might be a Fragment auction case
@@ -847,13 +752,7 @@ def create_channel():
             return jsonify({'success': False, 'message': 'Username and user ID are required'})
         
         # Get user data
-        try:
-            with open("config.json", "r") as f:
-                config_data = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return jsonify({'success': False, 'message': 'User not found in system'})
-        
-        user_data = config_data["users"].get(user_id, {})
+        user_data = store.get_user(user_id)
         if not user_data:
             return jsonify({'success': False, 'message': 'User not found in system'})
         
@@ -868,8 +767,7 @@ def create_channel():
             return jsonify({'success': False, 'message': 'API credentials not found'})
         
         # Check session
-        session_file = f'{user_id}.session'
-        if not os.path.exists(session_file):
+        if not session_manager.has_session(user_id):
             return jsonify({
                 'success': False,
                 'redirect': True,
@@ -880,15 +778,7 @@ def create_channel():
         # Verify session is valid before proceeding
         async def verify_session():
             try:
-                client = TelegramClient(session_file, api_id, api_hash)
-                await client.connect()
-                
-                if not await client.is_user_authorized():
-                    await client.disconnect()
-                    return False
-                
-                await client.disconnect()
-                return True
+                return await session_manager.is_authorized(user_id, force=True)
                 
             except Exception as e:
                 logger.error(f"Error verifying session: {e}")
@@ -907,11 +797,9 @@ def create_channel():
         # Create channel
         async def create_telegram_channel():
             try:
-                client = TelegramClient(session_file, api_id, api_hash)
-                await client.connect()
+                client = await session_manager.get_client(user_id)
                 
                 if not await client.is_user_authorized():
-                    await client.disconnect()
                     return {'success': False, 'message': 'Session expired. Please login again.'}
                 
                 # Create the channel
@@ -956,7 +844,6 @@ def create_channel():
                     logger.error(f"Error setting channel photo: {e}")
                     # Continue even if photo setting fails
                 
-                await client.disconnect()
                 
                 channel_link = f"https://t.me/{username}"
                 
@@ -967,10 +854,8 @@ def create_channel():
                 }
                 
             except UsernameOccupiedError:
-                await client.disconnect()
                 return {'success': False, 'message': 'Username is already taken'}
             except Exception as e:
-                await client.disconnect()
                 logger.error(f"Error creating channel: {e}")
                 return {'success': False, 'message': f'Error creating channel: {str(e)}'}
         
@@ -997,13 +882,7 @@ def set_username():
             return jsonify({'success': False, 'message': 'Invalid username format'})
         
         # Get user data
-        try:
-            with open("config.json", "r") as f:
-                config_data = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return jsonify({'success': False, 'message': 'User not found in system'})
-        
-        user_data = config_data["users"].get(user_id, {})
+        user_data = store.get_user(user_id)
         if not user_data:
             return jsonify({'success': False, 'message': 'User not found in system'})
         
@@ -1019,8 +898,7 @@ def set_username():
             return jsonify({'success': False, 'message': 'API credentials not found'})
         
         # Check session
-        session_file = f'{user_id}.session'
-        if not os.path.exists(session_file):
+        if not session_manager.has_session(user_id):
             return jsonify({
                 'success': False,
                 'redirect': True,
@@ -1031,15 +909,7 @@ def set_username():
         # Verify session is valid before proceeding
         async def verify_session():
             try:
-                client = TelegramClient(session_file, api_id, api_hash)
-                await client.connect()
-                
-                if not await client.is_user_authorized():
-                    await client.disconnect()
-                    return False
-                
-                await client.disconnect()
-                return True
+                return await session_manager.is_authorized(user_id, force=True)
                 
             except Exception as e:
                 logger.error(f"Error verifying session: {e}")
@@ -1058,23 +928,19 @@ def set_username():
         # Set username
         async def set_user_username():
             try:
-                client = TelegramClient(session_file, api_id, api_hash)
-                await client.connect()
+                client = await session_manager.get_client(user_id)
                 
                 if not await client.is_user_authorized():
-                    await client.disconnect()
                     return {'success': False, 'message': 'Session expired. Please login again.'}
                 
                 # First check if username is still available
                 try:
                     entity = await client.get_entity(username)
-                    await client.disconnect()
                     return {'success': False, 'message': 'Username is no longer available'}
                 except (UsernameNotOccupiedError, ValueError):
                     # Username is available, proceed
                     pass
                 except Exception as e:
-                    await client.disconnect()
                     logger.error(f"Error checking username availability: {e}")
                     return {'success': False, 'message': 'Error checking username availability'}
                 
@@ -1083,7 +949,6 @@ def set_username():
                 
                 try:
                     await client(UpdateUsernameRequest(username=username))
-                    await client.disconnect()
                     
                     return {
                         'success': True,
@@ -1091,10 +956,8 @@ def set_username():
                     }
                     
                 except UsernameOccupiedError:
-                    await client.disconnect()
                     return {'success': False, 'message': 'Username is already taken'}
                 except Exception as e:
-                    await client.disconnect()
                     logger.error(f"Error setting username: {e}")
                     return {'success': False, 'message': f'Error setting username: {str(e)}'}
                     
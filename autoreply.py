@@ -7,6 +7,11 @@ from telethon.errors.rpcerrorlist import AuthKeyUnregisteredError
 from telethon.errors import FloodWaitError
 from telethon.tl.types import MessageEntityMentionName
 from converter import handle_conversion_command
+from config_store import store
+from sessions import session_manager
+from matcher import compile_matcher
+from antidelete import CachedMessage, message_cache
+from collections import namedtuple
 import re
 import os
 import json
@@ -23,44 +28,46 @@ ADMIN_USERNAME = os.getenv("ADMIN_USERNAME", "devscottreal")
 
 FURL = "https://t.me/echofluxxx" 
 active_clients = {}
+# A user's client stays connected while their autoreply handlers are installed
+session_manager.add_keep_alive(lambda user_id: user_id in active_clients)
+autoreply_handlers = {}
 last_reply_time = {}
 
-# Anti-deleted message functionality
-message_cache = {}
-CACHE_EXPIRY = 86400
-last_cache_clean = datetime.datetime.now()
-
-def clean_expired_cache():
-    current_time = time.time()
-    for chat_id, messages in list(message_cache.items()):
-        for msg_id, message_data in list(messages.items()):
-            if (current_time - message_data["date"].timestamp()) > CACHE_EXPIRY:
-                del message_cache[chat_id][msg_id]
-        if not message_cache[chat_id]:
-            del message_cache[chat_id]
-
-def check_and_clean_cache():
-    global last_cache_clean
-    current_time = datetime.datetime.now()
-    if (current_time - last_cache_clean).total_seconds() >= 86400:
-        clean_expired_cache()
-        last_cache_clean = current_time
-
-def load_user_data():
-    try:
-        with open("config.json", "r") as f:
-            data = json.load(f)
-            if "users" not in data:
-                data["users"] = {}  
-            return data
-    except FileNotFoundError:
-        return {"users": {}}  
-    except json.JSONDecodeError:
-        return {"users": {}}  
-
-def save_user_data(data):
-    with open('config.json', 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=4)
+# What the running handlers need from a user's config. Each active client reads
+# its snapshot from client_settings; a store listener swaps in a new one on change.
+ClientSettings = namedtuple("ClientSettings", [
+    "matcher", "responder_option", "anti_deleted_enabled",
+    "deleted_monitor_mode", "deleted_group", "save_location",
+])
+client_settings = {}
+
+TAG_COMMAND = re.compile(r'/tag (.+)')
+
+
+def build_client_settings(user_data):
+    return ClientSettings(
+        matcher=compile_matcher(tuple(user_data.get("keywords", {}).items()), user_data.get("match_option", "exact")),
+        responder_option=user_data.get("responder_option", "PM"),
+        anti_deleted_enabled=user_data.get("anti_deleted_enabled", False),
+        deleted_monitor_mode=user_data.get("deleted_monitor_mode", "All"),
+        deleted_group=user_data.get("deleted_group"),
+        save_location=user_data.get("save_location", "chat"),
+    )
+
+
+def _refresh_client_settings(user_id, user_data):
+    # Store listener: only users with a running client keep a snapshot
+    if user_id not in client_settings:
+        return
+    if user_data is None:
+        client_settings.pop(user_id, None)
+        return
+    settings = build_client_settings(user_data)
+    if settings != client_settings.get(user_id):
+        client_settings[user_id] = settings
+
+
+store.add_listener(_refresh_client_settings)
 
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -114,16 +121,8 @@ async def set_word(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         keyword = message[0].strip()
         response = message[1].strip().replace('\\n', '\n')
 
-        data = load_user_data()
-
-        if user_id not in data["users"]:
-            data["users"][user_id] = {"keywords": {}}
-
-        if "keywords" not in data["users"][user_id]:
-            data["users"][user_id]["keywords"] = {}
-
-        data["users"][user_id]["keywords"][keyword] = response
-        save_user_data(data)
+        with store.edit(user_id) as user_data:
+            user_data.setdefault("keywords", {})[keyword] = response
 
         await update.message.reply_text(f"Keyword:\n<pre>{keyword}</pre> has been set with the response:\n <pre>{response}</pre>", parse_mode="HTML")
 
@@ -142,8 +141,7 @@ async def keyword_settings(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         return
 
     # Load user data
-    data = load_user_data()
-    user_data = data["users"].get(user_id, {})
+    user_data = store.get_user(user_id)
 
     match_option = user_data.get("match_option", "exact")
     auto_reply_status = "𝙴𝚗𝚊𝚋𝚕𝚎𝚍 ✅" if user_data.get("auto_reply_status", False) else "𝙳𝚒𝚜𝚊𝚋𝚕𝚎𝚍 ❌"
@@ -265,18 +263,15 @@ async def mark_all_messages_read(user_id):
         raise e
 
 async def start_telethon_client(user_id, context=None):
-    data = load_user_data()
-    user_data = data["users"].get(user_id)
+    user_data = store.get_user(user_id)
 
     if not user_data or not user_data.get("auto_reply_status"):
         return
 
-    user_data["client_active"] = True
-    save_user_data(data)
+    store.update_user(user_id, client_active=True)
 
-    session_file = f"{user_id}.session"
-    if not os.path.exists(session_file):
-        print(f"Session file for {user_id} does not exist. Ask the user to log in.")
+    if not session_manager.has_session(user_id):
+        print(f"No saved session for {user_id}. Ask the user to log in.")
         try:
             if context:
                 await context.bot.send_message(
@@ -284,70 +279,54 @@ async def start_telethon_client(user_id, context=None):
                     text="⚠️ <b>Session Error</b>\n\n❌ Your session file is missing\n📝 Please log in again to continue",
                     parse_mode="HTML"
                 )
-            user_data["auto_reply_status"] = False
-            save_user_data(data)
+            store.update_user(user_id, auto_reply_status=False)
         except Exception as e:
             print(f"Error sending message: {e}")
         return
 
-    api_id = user_data.get("api_id")
-    api_hash = user_data.get("api_hash")
-
-    client = TelegramClient(session_file, api_id, api_hash)
+    if user_id in active_clients:
+        await stop_telethon_client(user_id)
 
     try:
-        await client.connect()
+        client = await session_manager.get_client(user_id)
 
-        if not await client.is_user_authorized():
-            await client.disconnect()
-            if os.path.exists(session_file):  
-                os.remove(session_file)
-            await context.bot.send_message(
-                chat_id=user_id,
-                text="🔒 *Authorization Failed*\n\n❌ Your session was terminated\n📝 Please log in again to continue",
-                parse_mode="Markdown"
-            )
-            user_data["auto_reply_status"] = False
-            save_user_data(data)
+        if not await session_manager.is_authorized(user_id, force=True):
+            await session_manager.close(user_id, delete_session=True)
+            if context:
+                await context.bot.send_message(
+                    chat_id=user_id,
+                    text="🔒 *Authorization Failed*\n\n❌ Your session was terminated\n📝 Please log in again to continue",
+                    parse_mode="Markdown"
+                )
+            store.update_user(user_id, auto_reply_status=False)
             return
 
-        await client.disconnect()
-        await asyncio.sleep(3)
-        await client.start()
-    
     except AuthKeyUnregisteredError as e:
         print(f"Authorization error for user {user_id}: {e}")
-        await client.disconnect()
-        if os.path.exists(session_file): 
-            os.remove(session_file)
+        await session_manager.close(user_id, delete_session=True)
         if context:
             await context.bot.send_message(
                 chat_id=user_id,
                 text="🔒 *Authorization Failed*\n\n❌ Your session was terminated\n📝 Please log in again to continue",
                 parse_mode="Markdown"
             )
-        user_data["auto_reply_status"] = False
-        save_user_data(data)
+        store.update_user(user_id, auto_reply_status=False)
         return
 
     except Exception as e:
         print(f"Error starting Telethon client for user {user_id}: {e}")
-        user_data["client_active"] = False
-        save_user_data(data)
+        store.update_user(user_id, client_active=False)
         return
 
+    existing_handlers = client.list_event_handlers()
+    client_settings[user_id] = build_client_settings(store.get_user(user_id))
+
     async def handle_vv_command(event):
         """Handles the /vv command to download a specific self-destructing media."""
         try:
             user_id = str(event.sender_id)
-            data = load_user_data()
-            if user_id not in data["users"]:
-                data["users"][user_id] = {}
-            if "save_location" not in data["users"][user_id]:
-                data["users"][user_id]["save_location"] = "chat"  
-                save_user_data(data)
-
-            save_location = data["users"][user_id]["save_location"]
+            settings = client_settings.get(user_id)
+            save_location = settings.save_location if settings else "chat"
 
             reply = await event.message.get_reply_message()
             if not reply or not reply.media:
@@ -397,12 +376,10 @@ async def start_telethon_client(user_id, context=None):
             logger.exception(f"Error handling /vv command: {e}")
             await event.reply("An error occurred while processing the /vv command.")
 
-    @client.on(events.NewMessage(pattern='/tag (.+)'))
-    async def handle_tag_command(event):
+    async def handle_tag_command(event, message_text):
         try:
             sender = await event.get_sender()
             chat = await event.get_input_chat()
-            message_text = event.pattern_match.group(1)
             
             try:
                 from telethon.tl.functions.messages import SendReactionRequest
@@ -480,74 +457,59 @@ async def start_telethon_client(user_id, context=None):
             sender = await event.get_sender()
             await client.send_message(sender, f"Failed to tag members: {str(e)}")
 
-    @client.on(events.NewMessage)
-    async def cache_message_handler(event):
+    async def cache_message_handler(event, settings):
         """Cache messages for anti-deleted functionality"""
-        check_and_clean_cache()
-        
-        # Check if anti-deleted is enabled for this user
-        data = load_user_data()
-        user_data = data["users"].get(user_id, {})
-        if not user_data.get("anti_deleted_enabled", False):
-            return
-
-        monitor_mode = user_data.get("deleted_monitor_mode", "All")
+        monitor_mode = settings.deleted_monitor_mode
         is_group = event.is_group
 
         if (monitor_mode == "Groups" and not is_group) or (monitor_mode == "Private" and is_group):
             return
             
-        message_data = {
-            "sender_id": event.sender_id,  
-            "sender": await event.get_sender(),
-            "text": event.message.message,
-            "date": event.message.date,
-            "media": event.message.media,  
-        }
-
-        if event.chat_id:
-            if event.chat_id not in message_cache:
-                message_cache[event.chat_id] = {}
-            message_cache[event.chat_id][event.id] = message_data
-            
-        else:
-            sender_id = event.sender_id
-            if sender_id not in message_cache:
-                message_cache[sender_id] = {}
-            message_cache[sender_id][event.id] = message_data
-            
+        # Only what the update already carried; a missing sender is resolved if the message is deleted
+        message_data = CachedMessage.from_event(event)
+
+        # Deletions in private chats and basic groups carry no chat id, only the message id, which is
+        # unique per account there; channel and supergroup ids are only unique within the chat
+        message_cache.put(user_id, event.chat_id or event.sender_id, event.id, message_data, indexed=not event.is_channel)
+
+    async def cached_sender_name(message_data):
+        if message_data.sender_name:
+            return message_data.sender_name
+        sender = None
+        if message_data.sender_id:
+            try:
+                sender = await client.get_entity(message_data.sender_id)
+            except Exception as e:
+                print(f"Failed to fetch sender {message_data.sender_id}: {e}")
+        return getattr(sender, "first_name", None) or getattr(sender, "title", None) or "Unknown"
 
     @client.on(events.MessageDeleted)
     async def on_message_deleted(event):
         """Handle deleted messages"""
-        check_and_clean_cache()
-        
         # Check if anti-deleted is enabled for this user
-        data = load_user_data()
-        user_data = data["users"].get(user_id, {})
-        if not user_data.get("anti_deleted_enabled", False):
+        settings = client_settings.get(user_id)
+        if settings is None or not settings.anti_deleted_enabled:
             return
             
-        deleted_group = user_data.get("deleted_group")
+        deleted_group = settings.deleted_group
         if not deleted_group:
             return
             
         print(f"Deleted event detected: Chat {event.chat_id}, Message IDs {event.deleted_ids}")
 
+        group_name = None
         for msg_id in event.deleted_ids:
             if event.chat_id:
                 try:
-                    entity = await client.get_entity(event.chat_id)
-                    
-                    if event.chat_id in message_cache and msg_id in message_cache[event.chat_id]:
-                        message_data = message_cache[event.chat_id].pop(msg_id, None)
-                        if message_data:
-                            sender_id = message_data["sender_id"]
-                            sender_name = message_data["sender"].first_name if message_data["sender"] else "Unknown"
-                            time_str = message_data["date"].strftime("%Y-%m-%d %H:%M:%S")
-                            content = message_data["text"] or "Media/Non-text content"
-                            media = message_data["media"]
-                            group_name = ""
+                    message_data = message_cache.pop(user_id, event.chat_id, msg_id)
+                    if message_data:
+                        sender_id = message_data.sender_id
+                        sender_name = await cached_sender_name(message_data)
+                        time_str = message_data.time_str
+                        content = message_data.text or "Media/Non-text content"
+                        media = message_data.input_media()
+                        # One lookup per deletion event, however many of its messages were cached
+                        if group_name is None:
                             try:
                                 entity = await client.get_entity(event.chat_id)
                                 group_name = entity.title if hasattr(entity, 'title') else 'Unknown Group'
@@ -555,141 +517,113 @@ async def start_telethon_client(user_id, context=None):
                                 group_name = "Unknown Group"
                                 print(f"Failed to fetch group name: {e}")
 
-                            await log_deleted_message(client, sender_id, sender_name, group_name, time_str, content, media, deleted_group)
-                            print(f"Deleted group message logged from {sender_name} in group {group_name}: {content}")
+                        await log_deleted_message(client, sender_id, sender_name, group_name, time_str, content, media, deleted_group)
+                        print(f"Deleted group message logged from {sender_name} in group {group_name}: {content}")
                             
                 except Exception as e:
                     print(f"Failed to process group message: {e}")
             else:
                 # Handle private message deletions
-                for sender_id_cache in message_cache:
-                    if msg_id in message_cache[sender_id_cache]:
-                        message_data = message_cache[sender_id_cache].pop(msg_id, None)
-                        if message_data:
-                            sender_name = message_data["sender"].first_name if message_data["sender"] else "Unknown"
-                            content = message_data["text"] or "Media/Non-text content"
-                            time_str = message_data["date"].strftime("%Y-%m-%d %H:%M:%S")
-                            media = message_data["media"]
-
-                            await log_deleted_message(client, sender_id_cache, sender_name, "Private Chat", time_str, content, media, deleted_group)
-                            print(f"Deleted DM message logged from {sender_name}: {content}")
-                        break
-
-    @client.on(events.NewMessage)
-    async def handler(event):
+                message_data = message_cache.pop_message(user_id, msg_id)
+                if message_data:
+                    sender_name = await cached_sender_name(message_data)
+                    content = message_data.text or "Media/Non-text content"
+                    time_str = message_data.time_str
+                    media = message_data.input_media()
+
+                    await log_deleted_message(client, message_data.sender_id, sender_name, "Private Chat", time_str, content, media, deleted_group)
+                    print(f"Deleted DM message logged from {sender_name}: {content}")
+
+    async def handler(event, settings, message_text):
+        """Keyword autoreply. The chat is only looked up once a keyword has matched."""
         try:
+            found = settings.matcher.match(message_text)
+            if found is None:
+                return
+            keyword, response = found
+            responder_option = settings.responder_option
+            if (responder_option == "PM" and not event.is_private) or (responder_option == "GC" and not event.is_group):
+                return
+            if responder_option not in ("PM", "GC", "All"):
+                return
+
             chat = await event.get_chat()
+            if (responder_option == "PM" and not isinstance(chat, User)) or (responder_option == "GC" and not isinstance(chat, Chat)):
+                return
             chat_id = chat.id
             chat_name = chat.title if hasattr(chat, 'title') else chat.username or chat_id
-            message_text = event.message.message
+            print(f"✨ {settings.matcher.match_option.value} match found in {chat_name}: {keyword}")
 
-            if message_text.startswith('/vv') and event.message.is_reply:
-                await handle_vv_command(event)
-                return
-            if message_text.startswith('/conv') or message_text.startswith('/convert') or message_text.startswith('/c '):
-                await handle_conversion_command(event, user_id)
+            if chat_id in last_reply_time and (asyncio.get_event_loop().time() - last_reply_time[chat_id]) < 10:
+                print(f"⏳ Cooldown active in {chat_name}")
                 return
 
-            keywords = user_data.get("keywords", {})
-            match_option = user_data.get("match_option", "exact").lower()
-            responder_option = user_data.get("responder_option", "PM") 
-
-            for keyword, response in keywords.items():
-                if match_option == "exact":
-                    pattern = r"^" + re.escape(keyword) + r"$"
-                    if re.match(pattern, message_text, re.IGNORECASE):
-                        print(f"✨ Exact match found in {chat_name}: {keyword}")
-                elif match_option == "partial":
-                    pattern = r"\b" + re.escape(keyword) + r"\b"
-                    if re.search(pattern, message_text, re.IGNORECASE):
-                        print(f"✨ Partial match found in {chat_name}: {keyword}")
-                elif match_option == "case_insensitive":
-                    if keyword.lower() in message_text.lower():
-                        print(f"✨ Case-insensitive match found in {chat_name}: {keyword}")
-
-                if match_option in ["exact", "partial", "case_insensitive"] and (
-                    (match_option == "exact" and re.match(pattern, message_text, re.IGNORECASE)) or
-                    (match_option == "partial" and re.search(pattern, message_text, re.IGNORECASE)) or
-                    (match_option == "case_insensitive" and keyword.lower() in message_text.lower())
-                ):
-                    if responder_option == "PM" and isinstance(chat, User):
-                        if chat_id in last_reply_time and (asyncio.get_event_loop().time() - last_reply_time[chat_id]) < 10:
-                            print(f"⏳ Cooldown active in {chat_name}")
-                            return
-
-                        await asyncio.sleep(1)
-
-                        if response.startswith("https://t.me/"):
-                            await send_message_from_link(client, event, response)
-                        else:
-                            await event.reply(response)
-
-                        print(f"📤 Replied with: {response}")
-                        last_reply_time[chat_id] = asyncio.get_event_loop().time()
-                        await asyncio.sleep(10)
-                    elif responder_option == "GC" and isinstance(chat, Chat):
-                        if chat_id in last_reply_time and (asyncio.get_event_loop().time() - last_reply_time[chat_id]) < 10:
-                            print(f"⏳ Cooldown active in {chat_name}")
-                            return
-
-                        await asyncio.sleep(1)
-
-                        if response.startswith("https://t.me/"):
-                            await send_message_from_link(client, event, response)
-                        else:
-                            await event.reply(response)
-
-                        print(f"📤 Replied with: {response}")
-                        last_reply_time[chat_id] = asyncio.get_event_loop().time()
-                        await asyncio.sleep(10)
-
-                    elif responder_option == "All":
-                        if chat_id in last_reply_time and (asyncio.get_event_loop().time() - last_reply_time[chat_id]) < 10:
-                            print(f"⏳ Cooldown active in {chat_name}")
-                            return
-
-                        await asyncio.sleep(1)
-
-                        if response.startswith("https://t.me/"):
-                            await send_message_from_link(client, event, response)
-                        else:
-                            await event.reply(response)
-
-                        print(f"📤 Replied with: {response}")
-                        last_reply_time[chat_id] = asyncio.get_event_loop().time()
-                        await asyncio.sleep(10)
-                    return
+            await asyncio.sleep(1)
+
+            if response.startswith("https://t.me/"):
+                await send_message_from_link(client, event, response)
+            else:
+                await event.reply(response)
+
+            print(f"📤 Replied with: {response}")
+            last_reply_time[chat_id] = asyncio.get_event_loop().time()
+            await asyncio.sleep(10)
 
         except AuthKeyUnregisteredError as e:
             print(f"Authorization error for user {user_id}: {e}")
-            await client.disconnect()
-            if os.path.exists(session_file): 
-                os.remove(session_file)
+            await stop_telethon_client(user_id)
+            await session_manager.close(user_id, delete_session=True)
             if context:
                 await context.bot.send_message(
                     chat_id=user_id,
                     text="🔒 *Authorization Failed*\n\n❌ Your session was terminated\n📝 Please log in again to continue",
                     parse_mode="Markdown"
                 )
-            user_data["auto_reply_status"] = False
-            save_user_data(data)
+            store.update_user(user_id, auto_reply_status=False)
             return
 
         except Exception as e:
             print(f"Unexpected error while handling message: {e}")
 
+    @client.on(events.NewMessage)
+    async def dispatch(event):
+        """The one NewMessage handler: routes on the text and the user's flags before any entity lookup."""
+        settings = client_settings.get(user_id)
+        if settings is None:
+            return
+        message_text = event.message.message or ""
+        try:
+            if settings.anti_deleted_enabled:
+                await cache_message_handler(event, settings)
+
+            if message_text.startswith('/'):
+                tag = TAG_COMMAND.match(message_text)
+                if tag:
+                    await handle_tag_command(event, tag.group(1))
+                    return
+                if message_text.startswith('/vv') and event.message.is_reply:
+                    await handle_vv_command(event)
+                    return
+                if message_text.startswith(('/conv', '/convert', '/c ')):
+                    await handle_conversion_command(event, user_id)
+                    return
+
+            await handler(event, settings, message_text)
+        except Exception as e:
+            print(f"Unexpected error while dispatching message: {e}")
+
     try:
         print(f"✅ Telethon client started successfully for user {user_id}")
-        user_data["client_active"] = True
-        save_user_data(data)
+        store.update_user(user_id, client_active=True)
 
         active_clients[user_id] = client
-        asyncio.create_task(client.run_until_disconnected())
+        autoreply_handlers[user_id] = [
+            handler for handler in client.list_event_handlers() if handler not in existing_handlers
+        ]
 
     except Exception as e:
         print(f"❌ Error starting Telethon client for user {user_id}: {e}")
-        user_data["client_active"] = False
-        save_user_data(data)
+        store.update_user(user_id, client_active=False)
         
 async def send_message_from_link(client, event, link):
     pattern = r"https://t.me/([a-zA-Z0-9_]+)/(\d+)"
@@ -709,29 +643,22 @@ async def send_message_from_link(client, event, link):
         await event.reply("Invalid message link.")
 
 async def stop_telethon_client(user_id):
-    data = load_user_data()
-    user_data = data["users"].get(user_id)
-
     client = active_clients.get(user_id)
 
     if client is None:
         print(f"No active Telethon client found for user {user_id}")
         return
 
+    # The client itself belongs to the session manager and stays connected for other features
     try:
-        if client.is_connected():
-            print(f"Disconnecting Telethon client for user {user_id}")
-            await client.disconnect()
-            print(f"Telethon client disconnected for user {user_id}")
+        for callback, event in autoreply_handlers.pop(user_id, []):
+            client.remove_event_handler(callback, event)
+        print(f"Autoreply handlers removed for user {user_id}")
 
-        user_data["client_active"] = False
-        save_user_data(data)
+        store.update_user(user_id, client_active=False)
         del active_clients[user_id]
+        client_settings.pop(user_id, None)
+        message_cache.drop_user(user_id)
 
     except Exception as e:
         print(f"Error stopping Telethon client for user {user_id}: {e}")
-
-    finally:
-        if client.is_connected():
-            await client.disconnect()
-        print(f"Client status after disconnection for user {user_id}: {client.is_connected()}")
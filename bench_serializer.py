@@ -0,0 +1,76 @@
+"""Compare config load/save times: stdlib json (indent=4, the old format) vs serializer.
+
+Run with ``python bench_serializer.py [users] [rounds]``; defaults to 1000 users, 20 rounds.
+"""
+import json
+import random
+import string
+import sys
+import time
+
+import serializer
+
+
+def make_config(users):
+    rng = random.Random(42)
+
+    def word(n=8):
+        return "".join(rng.choice(string.ascii_lowercase) for _ in range(n))
+
+    config = {"users": {}}
+    for i in range(users):
+        user_id = str(5000000000 + i)
+        config["users"][user_id] = {
+            "expiry_date": "2030-01-01 00:00:00",
+            "api_id": str(rng.randint(100000, 9999999)),
+            "api_hash": word(32),
+            "post_messages": [f"https://t.me/{word()}/{rng.randint(1, 9999)}" for _ in range(rng.randint(1, 5))],
+            "post_index": 0,
+            "message_source": "mypost",
+            "interval": str(rng.choice([60, 300, 600])),
+            "groups": [f"https://t.me/{word()}" for _ in range(rng.randint(5, 40))],
+            "keywords": {word(5): word(30) for _ in range(rng.randint(0, 10))},
+            "match_option": "exact",
+            "auto_reply_status": False,
+            "forwarding_on": rng.random() < 0.5,
+            "responder_option": "PM",
+            "scraped_groups": {str(-1000000000000 - j): {"title": word(12), "count": rng.randint(10, 5000)}
+                               for j in range(rng.randint(0, 3))},
+        }
+    return config
+
+
+def best_of(rounds, fn):
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    config = make_config(users)
+
+    old_payload = json.dumps(config, indent=4)
+    new_payload = serializer.dumps(config)
+
+    results = [
+        ("stdlib indent=4", len(old_payload.encode("utf-8")),
+         best_of(rounds, lambda: json.dumps(config, indent=4)),
+         best_of(rounds, lambda: json.loads(old_payload))),
+        (f"serializer ({serializer.BACKEND})", len(new_payload),
+         best_of(rounds, lambda: serializer.dumps(config)),
+         best_of(rounds, lambda: serializer.loads(new_payload))),
+    ]
+
+    print(f"{users} users, best of {rounds} rounds")
+    print(f"{'format':<24}{'size KB':>10}{'save ms':>10}{'load ms':>10}")
+    for name, size, save, load in results:
+        print(f"{name:<24}{size / 1024:>10.1f}{save * 1000:>10.2f}{load * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
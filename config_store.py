@@ -0,0 +1,241 @@
+import asyncio
+import atexit
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from models import UserRecord
+from storage import make_backend
+
+CONFIG_FILE = "config.json"
+# "journal" appends changes to config.journal and compacts into config.json,
+# "json" rewrites config.json on every flush, "sqlite" uses config.db (WAL) with per-user rows
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "journal").lower()
+SQLITE_FILE = os.getenv("SQLITE_FILE", "config.db")
+# Compact the journal into config.json once it reaches this size or age
+JOURNAL_MAX_BYTES = int(os.getenv("JOURNAL_MAX_BYTES", str(1024 * 1024)))
+JOURNAL_COMPACT_INTERVAL = float(os.getenv("JOURNAL_COMPACT_INTERVAL", "300"))
+# Seconds to wait after the last change before config.json is rewritten
+FLUSH_DELAY = float(os.getenv("CONFIG_FLUSH_DELAY", "2"))
+# Upper bound on how long a busy store may keep postponing the write
+MAX_FLUSH_DELAY = float(os.getenv("CONFIG_MAX_FLUSH_DELAY", "10"))
+
+logger = logging.getLogger(__name__)
+
+
+class ConfigStore:
+    """Process-wide copy of the user config kept in memory.
+
+    Reads never touch the disk. Changes go through ``edit``/``update_user``/
+    ``delete_user`` which mark the user record dirty, and a background timer
+    hands the dirty records to the storage backend once things have been quiet
+    for ``flush_delay`` seconds.
+    """
+
+    def __init__(self, backend=None, flush_delay=FLUSH_DELAY, max_flush_delay=MAX_FLUSH_DELAY):
+        self.backend = backend or make_backend(
+            STORAGE_BACKEND, CONFIG_FILE, SQLITE_FILE,
+            max_bytes=JOURNAL_MAX_BYTES, compact_interval=JOURNAL_COMPACT_INTERVAL,
+        )
+        self.flush_delay = flush_delay
+        self.max_flush_delay = max_flush_delay
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()
+        self._dirty = set()
+        self._timer = None
+        self._dirty_since = None
+        self._listeners = []
+        self._records = {}
+        self._queue = None
+        self._writer_loop = None
+        self.data = self.backend.load()
+
+    @property
+    def users(self):
+        return self.data["users"]
+
+    def has_user(self, user_id):
+        return user_id in self.data["users"]
+
+    def get_user(self, user_id):
+        """Return the live record for ``user_id`` (or an empty dict). Do not mutate it directly."""
+        return self.data["users"].get(user_id) or {}
+
+    def record(self, user_id):
+        """Return the parsed ``UserRecord`` for ``user_id`` (None if unknown), cached until it changes."""
+        record = self._records.get(user_id)
+        if record is None:
+            with self._lock:
+                data = self.data["users"].get(user_id)
+                if data is None:
+                    return None
+                record = self._records[user_id] = UserRecord(user_id, data)
+        return record
+
+    @contextmanager
+    def edit(self, user_id, create=False):
+        """Yield the user's record for in-place changes.
+
+        Without ``create`` a user that doesn't exist (e.g. deleted while a
+        forwarding tick or a queued Flask change was in flight) gets a scratch
+        dict that is thrown away, so late writes can't bring the user back as a
+        partial record. Users are created through ``set_user``.
+        """
+        with self._lock:
+            record = self.data["users"].get(user_id)
+            if record is None:
+                if not create:
+                    logger.debug(f"Ignoring change to unknown user {user_id}")
+                    yield {}
+                    return
+                record = self.data["users"][user_id] = {}
+            try:
+                yield record
+            finally:
+                self._mark_dirty(user_id)
+
+    def update_user(self, user_id, create=False, **fields):
+        with self.edit(user_id, create) as record:
+            record.update(fields)
+        return record
+
+    def set_user(self, user_id, record):
+        with self._lock:
+            self.data["users"][user_id] = record
+            self._mark_dirty(user_id)
+
+    def delete_user(self, user_id):
+        with self._lock:
+            record = self.data["users"].pop(user_id, None)
+            if record is not None:
+                self._mark_dirty(user_id)
+            return record
+
+    def replace(self, data):
+        """Swap in a whole new config (used by /setjson)."""
+        if "users" not in data:
+            data["users"] = {}
+        with self._lock:
+            changed = set(self.data["users"]) | set(data["users"])
+            self.data = data
+            self._dirty.update(changed)
+            for user_id in changed:
+                self._notify(user_id)
+        self._schedule_flush()
+
+    def reload(self):
+        """Re-read the config from the backend, replacing the in-memory copy."""
+        with self._lock:
+            changed = set(self.data["users"])
+            self.data = self.backend.load()
+            self._dirty.clear()
+            self._dirty_since = None
+            for user_id in changed | set(self.data["users"]):
+                self._notify(user_id)
+
+    def submit(self, user_id, mutation):
+        """Queue ``mutation(record)`` for the writer task; safe to call from any thread.
+
+        Used by code running outside the bot's event loop (the Flask thread).
+        If the writer isn't running the mutation is applied straight away.
+        """
+        loop = self._writer_loop
+        if loop is None or loop.is_closed():
+            with self.edit(user_id) as record:
+                mutation(record)
+            return
+        loop.call_soon_threadsafe(self._queue.put_nowait, (user_id, mutation))
+
+    async def run_writer(self):
+        """Apply submitted mutations one batch at a time on the bot's event loop.
+
+        Everything queued since the last wake-up is applied together, grouped by
+        user, so a burst of submissions costs one edit (and one listener call) per user.
+        """
+        self._queue = asyncio.Queue()
+        self._writer_loop = asyncio.get_running_loop()
+        try:
+            while True:
+                batch = [await self._queue.get()]
+                while not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                by_user = {}
+                for user_id, mutation in batch:
+                    by_user.setdefault(user_id, []).append(mutation)
+                with self._lock:
+                    for user_id, mutations in by_user.items():
+                        with self.edit(user_id) as record:
+                            for mutation in mutations:
+                                try:
+                                    mutation(record)
+                                except Exception as e:
+                                    logger.error(f"Queued config change for user {user_id} failed: {e}")
+        finally:
+            self._writer_loop = None
+            # Anything still queued is applied directly so it isn't lost on shutdown
+            while self._queue is not None and not self._queue.empty():
+                user_id, mutation = self._queue.get_nowait()
+                with self.edit(user_id) as record:
+                    mutation(record)
+
+    def add_listener(self, callback):
+        """Call ``callback(user_id, record)`` after every change; ``record`` is None once deleted.
+
+        Listeners run with the store lock held, so they must be quick and must not
+        edit the store themselves.
+        """
+        self._listeners.append(callback)
+
+    def _notify(self, user_id):
+        self._records.pop(user_id, None)
+        record = self.data["users"].get(user_id)
+        for callback in self._listeners:
+            try:
+                callback(user_id, record)
+            except Exception as e:
+                logger.error(f"Config listener {callback!r} failed for user {user_id}: {e}")
+
+    def _mark_dirty(self, user_id):
+        self._dirty.add(user_id)
+        self._notify(user_id)
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._dirty_since is None:
+                self._dirty_since = now
+            if self._timer is not None:
+                if now - self._dirty_since >= self.max_flush_delay:
+                    return
+                self._timer.cancel()
+            delay = min(self.flush_delay, self._dirty_since + self.max_flush_delay - now)
+            self._timer = threading.Timer(max(delay, 0), self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """Write pending changes to disk now."""
+        with self._write_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                self._dirty_since = None
+                if not self._dirty:
+                    return
+                payload = self.backend.snapshot(self.data, set(self._dirty))
+                self._dirty.clear()
+            self.backend.write(payload)
+
+    def export(self):
+        """Flush and return the path of a JSON file holding the whole config (for /getjson)."""
+        self.flush()
+        with self._write_lock, self._lock:
+            return self.backend.export(self.data)
+
+
+store = ConfigStore()
+atexit.register(store.flush)
@@ -6,6 +6,7 @@ import time
 from datetime import datetime, timedelta
 from typing import Optional, Tuple, Dict
 import json
+import serializer
 import os
 
 # Set up logging
@@ -132,8 +133,7 @@ class CurrencyConverter:
         """Load user usage data from file"""
         try:
             if os.path.exists(self.user_usage_file):
-                with open(self.user_usage_file, 'r') as f:
-                    return json.load(f)
+                return serializer.read_file(self.user_usage_file)
         except Exception as e:
             logger.error(f"Error loading user usage data: {e}")
         return {}
@@ -141,8 +141,7 @@ class CurrencyConverter:
     def save_user_usage(self):
         """Save user usage data to file"""
         try:
-            with open(self.user_usage_file, 'w') as f:
-                json.dump(self.user_usage, f, indent=2)
+            serializer.write_file(self.user_usage_file, self.user_usage)
         except Exception as e:
             logger.error(f"Error saving user usage data: {e}")
 
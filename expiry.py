@@ -0,0 +1,85 @@
+import heapq
+import logging
+import threading
+from datetime import datetime
+
+from config_store import store
+from models import EXPIRY_FORMAT
+
+logger = logging.getLogger(__name__)
+
+
+class ExpiryIndex:
+    """Parsed subscription expiry per user plus a min-heap of upcoming expirations.
+
+    Kept in sync with the config store through a listener, so checking a user
+    is a dict lookup and the date string is only parsed when it changes.
+    Heap entries are not removed on update; stale ones are skipped when popped.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._raw = {}
+        self._expiry = {}
+        self._heap = []
+
+    def rebuild(self, users):
+        with self._lock:
+            self._raw.clear()
+            self._expiry.clear()
+            self._heap = []
+        for user_id, record in list(users.items()):
+            self.update(user_id, record)
+
+    def update(self, user_id, record):
+        raw = record.get("expiry_date") if record else None
+        with self._lock:
+            if user_id in self._raw and self._raw[user_id] == raw:
+                return
+            self._raw[user_id] = raw
+            self._expiry.pop(user_id, None)
+            if record is None:
+                del self._raw[user_id]
+                return
+            if not raw:
+                return
+            try:
+                expiry = datetime.strptime(raw, EXPIRY_FORMAT)
+            except (TypeError, ValueError) as e:
+                logger.error(f"Date parsing error for user {user_id}: {e}")
+                return
+            self._expiry[user_id] = expiry
+            heapq.heappush(self._heap, (expiry, user_id))
+
+    def get(self, user_id):
+        return self._expiry.get(user_id)
+
+    def is_active(self, user_id, now=None):
+        expiry = self._expiry.get(user_id)
+        return expiry is not None and expiry > (now or datetime.now())
+
+    def next_expiry(self):
+        with self._lock:
+            while self._heap:
+                expiry, user_id = self._heap[0]
+                if self._expiry.get(user_id) == expiry:
+                    return expiry
+                heapq.heappop(self._heap)
+        return None
+
+    def pop_expired(self, now=None):
+        """Remove and return the users whose subscription has run out."""
+        now = now or datetime.now()
+        expired = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                expiry, user_id = heapq.heappop(self._heap)
+                if self._expiry.get(user_id) == expiry:
+                    del self._expiry[user_id]
+                    expired.append(user_id)
+        return expired
+
+
+expiry_index = ExpiryIndex()
+expiry_index.rebuild(store.users)
+store.add_listener(expiry_index.update)
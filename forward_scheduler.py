@@ -0,0 +1,100 @@
+import asyncio
+import logging
+import os
+
+# Lag (seconds behind the deadline) above which a tick is logged as late
+SCHEDULER_LAG_WARNING = float(os.getenv("SCHEDULER_LAG_WARNING", "5"))
+
+logger = logging.getLogger(__name__)
+
+
+class ForwardScheduler:
+    """One forwarding worker per user, ticking on fixed deadlines.
+
+    Each tick is due at the previous deadline plus the user's current interval,
+    so the cadence doesn't drift by however long a run took. A user never has
+    two runs at once: the next tick waits for the current one to finish, and
+    ticks missed by a long run are skipped rather than replayed back to back.
+    ``lag`` reports how late the last tick started.
+    """
+
+    def __init__(self, lag_warning=SCHEDULER_LAG_WARNING):
+        self.lag_warning = lag_warning
+        self._workers = {}
+        self._lag = {}
+        self._skipped = {}
+
+    def is_running(self, user_id):
+        return user_id in self._workers
+
+    def start(self, user_id, job, args, interval):
+        """Start ticking ``job(*args)`` for ``user_id``; ``interval()`` gives the current period.
+
+        Returns False if the user already has a worker.
+        """
+        if user_id in self._workers:
+            return False
+        task = asyncio.get_running_loop().create_task(self._run(user_id, job, args, interval))
+        self._workers[user_id] = task
+        return True
+
+    def stop(self, user_id):
+        """Stop the user's worker. Returns False if none was running.
+
+        Called from inside the user's own run (e.g. forwarding turning itself
+        off), the run is allowed to finish and no further tick is scheduled.
+        """
+        task = self._workers.pop(user_id, None)
+        if task is None:
+            return False
+        if task is not asyncio.current_task():
+            task.cancel()
+        return True
+
+    def stop_all(self):
+        for user_id in list(self._workers):
+            self.stop(user_id)
+
+    def lag(self, user_id):
+        return self._lag.get(user_id)
+
+    def skipped(self, user_id):
+        return self._skipped.get(user_id, 0)
+
+    async def _run(self, user_id, job, args, interval):
+        loop = asyncio.get_running_loop()
+        task = asyncio.current_task()
+        deadline = loop.time()
+        try:
+            while self._workers.get(user_id) is task:
+                lag = loop.time() - deadline
+                self._lag[user_id] = lag
+                if lag > self.lag_warning:
+                    logger.warning(f"Forwarding tick for user {user_id} started {lag:.1f}s late")
+                try:
+                    await job(*args)
+                except Exception as e:
+                    logger.error(f"Forwarding run for user {user_id} failed: {e}")
+                if self._workers.get(user_id) is not task:
+                    break
+
+                period = max(1, interval())
+                deadline += period
+                now = loop.time()
+                if now - deadline >= period:
+                    missed = int((now - deadline) // period)
+                    deadline += missed * period
+                    self._skipped[user_id] = self._skipped.get(user_id, 0) + missed
+                    logger.warning(f"Forwarding for user {user_id} overran, skipped {missed} tick(s)")
+                await asyncio.sleep(max(0, deadline - now))
+        except asyncio.CancelledError:
+            pass
+        finally:
+            if self._workers.get(user_id) is task:
+                del self._workers[user_id]
+            if user_id not in self._workers:
+                self._lag.pop(user_id, None)
+                self._skipped.pop(user_id, None)
+
+
+forward_scheduler = ForwardScheduler()
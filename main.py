@@ -5,7 +5,7 @@ from telethon.sync import TelegramClient
 from telethon import TelegramClient, events, functions
 from telethon.sessions import StringSession
 from dotenv import load_dotenv
-from telethon.errors import SessionPasswordNeededError, PeerFloodError, UserPrivacyRestrictedError, UserIsBlockedError
+from telethon.errors import SessionPasswordNeededError, PeerFloodError, FloodWaitError, UserPrivacyRestrictedError, UserIsBlockedError
 from scraper import *
 
 import os
@@ -13,60 +13,40 @@ import json
 from datetime import datetime, timedelta
 import datetime
 import time
+from time import monotonic
 import asyncio
+import random
 import requests
 import http.server
 import socketserver
 import threading
 from app import start_flask_app
+from config_store import store
+from expiry import expiry_index
+from models import DEFAULT_INTERVAL, parse_destination
+from sessions import session_manager
+from session_vault import session_vault
+from peer_cache import peer_cache, PEER_ERRORS
+from rate_governor import rate_governor
+import scraped_store
 import json
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from forward_scheduler import forward_scheduler
+from workers import worker_supervisor
 from autoreply import set_word, keyword_settings, start_telethon_client, stop_telethon_client
+from antidelete import message_cache
 from stats import *
 from payment import *
 
 load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
-scheduler = AsyncIOScheduler()
 ADMIN_IDS = os.getenv("ADMIN_IDS").split(',') 
 ADMIN_USERNAME = os.getenv("ADMIN_USERNAME", "echoFluxxx")
 WEBAPP = os.getenv("WEBAPP")
-session_lock = asyncio.Lock()
-
-def load_config():
-    try:
-        with open('config.json', 'r') as f:
-            config = json.load(f)
-            if "users" not in config:
-                config["users"] = {}  
-            return config
-    except FileNotFoundError:
-
-        config = {"users": {}}
-        save_config(config)  
-        return config
-    except json.JSONDecodeError:
-        return {"users": {}}
-
-def save_config(config):
-    with open('config.json', 'w') as f:
-        json.dump(config, f, indent=4)
-
-def load_user_data():
-    try:
-        with open("config.json", "r") as f:
-            data = json.load(f)
-            if "users" not in data:
-                data["users"] = {}  
-            return data
-    except FileNotFoundError:
-        return {"users": {}}  
-    except json.JSONDecodeError:
-        return {"users": {}}  
-
-def save_user_data(data):
-    with open('config.json', 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=4)
+# Longest the expiry sweeper sleeps between checks, in seconds
+EXPIRY_SWEEP_INTERVAL = int(os.getenv("EXPIRY_SWEEP_INTERVAL", "60"))
+# Seconds over which active users are restarted after a restart, and how many connect at once
+REHYDRATE_WINDOW = float(os.getenv("REHYDRATE_WINDOW", "60"))
+REHYDRATE_CONCURRENCY = int(os.getenv("REHYDRATE_CONCURRENCY", "5"))
 
 logging.basicConfig(
     level=logging.INFO,  
@@ -77,41 +57,171 @@ logger = logging.getLogger(__name__)
 async def is_authorized(user_id: str) -> bool:
     if user_id in ADMIN_IDS:
         return True
-    data = load_user_data()
-    if user_id in data["users"]:
-        expiry_date = data["users"][user_id].get("expiry_date")
-
-        if expiry_date:
+    return expiry_index.is_active(user_id)
+
+async def teardown_user(user_id: str, delete_session: bool = False) -> None:
+    """Stop everything running for a user and drop their record and per-user state."""
+    await stop_forwarding(user_id)
+    await stop_autoreply(user_id)
+    worker_supervisor.send(user_id, "close")
+    await session_manager.close(user_id, delete_session=delete_session)
+    store.delete_user(user_id)
+    scraped_store.remove(user_id)
+    peer_cache.drop_user(user_id)
+    rate_governor.drop_user(user_id)
+    tracker.drop_user(user_id)
+
+async def expire_user(user_id: str) -> None:
+    logger.info(f"Subscription for user {user_id} has expired.")
+    await teardown_user(user_id)
+
+async def expiry_sweeper() -> None:
+    """Expire subscriptions on time, waking at the next expiry (or at least every EXPIRY_SWEEP_INTERVAL)."""
+    while True:
+        for user_id in expiry_index.pop_expired():
+            if user_id in ADMIN_IDS:
+                continue
             try:
+                await expire_user(user_id)
+            except Exception as e:
+                logger.error(f"Error expiring user {user_id}: {e}")
+
+        delay = EXPIRY_SWEEP_INTERVAL
+        next_expiry = expiry_index.next_expiry()
+        if next_expiry is not None:
+            delay = min(delay, max((next_expiry - datetime.now()).total_seconds(), 0) + 1)
+        await asyncio.sleep(delay)
+
+async def start_forwarding(user_id: str, update: Update = None, context=None) -> bool:
+    """Start the user's forwarding worker, here or in the worker process that owns the user."""
+    if worker_supervisor.enabled:
+        # The worker's client takes over; don't keep a second connection open in this process
+        await session_manager.close(user_id)
+        worker_supervisor.send(user_id, "forward_start")
+        return True
+    record = store.record(user_id)
+    if record is None:
+        return False
+    job = forward_saved if record.message_source == "saved_messages" else forward_messages
+    return forward_scheduler.start(user_id, job, (update, context, user_id), lambda: forwarding_interval(user_id))
+
+async def stop_forwarding(user_id: str) -> bool:
+    if worker_supervisor.enabled:
+        worker_supervisor.send(user_id, "forward_stop")
+        return True
+    return forward_scheduler.stop(user_id)
 
-                expiry_datetime = datetime.strptime(expiry_date, '%Y-%m-%d %H:%M:%S')
-                logger.info(f"Parsed expiry date for user {user_id}: {expiry_datetime}")
+async def start_autoreply(user_id: str, context) -> None:
+    if worker_supervisor.enabled:
+        await session_manager.close(user_id)
+        worker_supervisor.send(user_id, "autoreply_start")
+        return
+    await start_telethon_client(user_id, context)
 
-                if expiry_datetime > datetime.now():
-                    return True
-                else:
-                    logger.info(f"Subscription for user {user_id} has expired.")
-                    data["users"][user_id]["forwarding_on"] = False 
-                    data["users"].pop(user_id, None) 
-                    save_user_data(data)
-            except ValueError as e:
-                logger.error(f"Date parsing error for user {user_id}: {e}")
-        else:
-            logger.info(f"No expiry date found for user {user_id}.")
+async def stop_autoreply(user_id: str) -> None:
+    if worker_supervisor.enabled:
+        worker_supervisor.send(user_id, "autoreply_stop")
+        return
+    await stop_telethon_client(user_id)
+
+async def rehydrate_user(context, user_id: str, semaphore: asyncio.Semaphore) -> str:
+    """Bring back forwarding and autoreply for one user that had them on before the restart."""
+    async with semaphore:
+        record = store.record(user_id)
+        if record is None:
+            return "gone"
+        if record.forwarding_on and not forward_scheduler.is_running(user_id):
+            if await session_manager.is_authorized(user_id, force=True):
+                await start_forwarding(user_id)
+            else:
+                store.update_user(user_id, forwarding_on=False)
+                return "logged out"
+        if record.auto_reply_status:
+            await start_autoreply(user_id, context)
+        return "restored"
+
+async def rehydrate_users(context) -> None:
+    """Restart every user that was forwarding or auto-replying when the bot went down.
+
+    Each user starts at a random point within REHYDRATE_WINDOW seconds and at
+    most REHYDRATE_CONCURRENCY clients connect at the same time. ``context`` is
+    anything with a ``.bot`` (the application, or a worker's Bot) for autoreply's messages.
+    """
+    user_ids = [
+        user_id for user_id, data in list(store.users.items())
+        if (data.get("forwarding_on") or data.get("auto_reply_status")) and await is_authorized(user_id)
+    ]
+    if not user_ids:
+        return
+    logger.info(f"Rehydrating {len(user_ids)} active users over {REHYDRATE_WINDOW:.0f}s")
+    semaphore = asyncio.Semaphore(max(1, REHYDRATE_CONCURRENCY))
+    results = {}
+
+    async def delayed(user_id):
+        await asyncio.sleep(random.uniform(0, REHYDRATE_WINDOW))
+        try:
+            outcome = await rehydrate_user(context, user_id, semaphore)
+        except Exception as e:
+            logger.error(f"Error rehydrating user {user_id}: {e}")
+            outcome = "failed"
+        results[outcome] = results.get(outcome, 0) + 1
+        done = sum(results.values())
+        if done % 10 == 0 or done == len(user_ids):
+            logger.info(f"Rehydrated {done}/{len(user_ids)} users ({results})")
+
+    await asyncio.gather(*(delayed(user_id) for user_id in user_ids))
+
+# Forwarding ticks lease the client; keep it connected between them
+session_manager.add_keep_alive(forward_scheduler.is_running)
+
+@register_stats_section
+def scheduler_stats(user_id: str, is_admin: bool):
+    lag = forward_scheduler.lag(user_id)
+    if lag is None:
+        return None
+    text = f"\n*Scheduler:*\nLast tick lag: `{max(lag, 0):.2f}s`\n"
+    if forward_scheduler.skipped(user_id):
+        text += f"Skipped ticks: `{forward_scheduler.skipped(user_id)}`\n"
+    return text
+
+@register_stats_section
+def antidelete_stats(user_id: str, is_admin: bool):
+    if not is_admin:
+        return None
+    cache = message_cache.stats()
+    return (
+        "\n*Anti-delete Cache:*\n"
+        f"Messages: `{cache['messages']}`\n"
+        f"Memory: `{cache['bytes'] / 1048576:.1f}` / `{cache['max_bytes'] / 1048576:.0f}` MB\n"
+        f"Hit rate: `{cache['hit_rate']:.1%}`\n"
+        f"Evicted: `{cache['evictions']}`, expired: `{cache['expirations']}`\n"
+    )
+
+async def post_init(application: Application) -> None:
+    session_manager.bind_loop(asyncio.get_running_loop())
+    application.create_task(store.run_writer())
+    application.create_task(expiry_sweeper())
+    application.create_task(session_manager.run_idle_sweeper())
+    if worker_supervisor.enabled:
+        # Each worker rehydrates its own users once it has their config
+        worker_supervisor.start()
     else:
-        logger.info(f"User {user_id} not found in the database.")
+        application.create_task(rehydrate_users(application))
 
-    return False
+async def post_shutdown(application: Application) -> None:
+    forward_scheduler.stop_all()
+    if worker_supervisor.enabled:
+        worker_supervisor.stop()
+    await session_manager.close_all()
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = str(update.message.from_user.id).strip() 
     logger.info(f"Checking subscription for user: {user_id}")
 
-    data = load_user_data()
-    if user_id in ADMIN_IDS and user_id not in data["users"]:
+    if user_id in ADMIN_IDS and not store.has_user(user_id):
         
         expiry = datetime.now() + timedelta(days=365)
-        data["users"][user_id] = {
+        store.set_user(user_id, {
             "expiry_date": expiry.strftime('%Y-%m-%d %H:%M:%S'),
             "forwarding_on": False,
             "post_messages": [],
@@ -122,11 +232,10 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             "match_option": "exact",
             "auto_reply_status": False,
             "responder_option": "PM"
-        }
-        save_user_data(data)
+        })
         logger.info(f"Added automatic subscription for admin {user_id}")
-    if user_id in data["users"]:
-        expiry_date = data["users"][user_id]["expiry_date"]
+    if store.has_user(user_id):
+        expiry_date = store.get_user(user_id)["expiry_date"]
         try:
 
             expiry_datetime = datetime.strptime(expiry_date, '%Y-%m-%d %H:%M:%S')
@@ -170,8 +279,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
                 parse_mode="HTML"
             )
 
-            data["users"][user_id]["forwarding_on"] = False
-            save_user_data(data)
+            store.update_user(user_id, forwarding_on=False)
     else:
 
         logger.info(f"User {user_id} is not authorized or subscription has expired.")
@@ -180,9 +288,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             parse_mode="HTML"
         )
 
-        if user_id in data["users"]:
-            data["users"][user_id]["forwarding_on"] = False
-        save_user_data(data)
+        if store.has_user(user_id):
+            store.update_user(user_id, forwarding_on=False)
 
 
 async def post(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -195,18 +302,13 @@ async def post(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             
             post_message = post_message.replace('\\n', '\n')
 
-            data = load_user_data()
-
-            if user_id in data["users"]:
+            if store.has_user(user_id):
                 try:
 
-                    if "post_messages" not in data["users"][user_id]:
-                        data["users"][user_id]["post_messages"] = []
-
-                    data["users"][user_id]["post_messages"].append(post_message)
-                    save_user_data(data)  
+                    with store.edit(user_id) as user_data:
+                        user_data.setdefault("post_messages", []).append(post_message)
+                        post_index = len(user_data["post_messages"])  
 
-                    post_index = len(data["users"][user_id]["post_messages"])  
                     await update.message.reply_text(f"Awesome! 🎉 Your message has been saved with index number {post_index} ✅\n\nWant to add more? Just use\n`/post your message here` 📝\n\nPreview of your message:\n`{post_message}`", parse_mode="Markdown")
                 except Exception as e:
                     await update.message.reply_text(f"Oops! 😅 Couldn't save your message: {e}", parse_mode=None)
@@ -225,13 +327,11 @@ async def delpost(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
             if context.args[0].lower() == 'all':
 
-                data = load_user_data()
-
-                if user_id in data["users"] and "post_messages" in data["users"][user_id]:
+                if "post_messages" in store.get_user(user_id):
                     try:
-                        deleted_posts = data["users"][user_id]["post_messages"]
-                        data["users"][user_id]["post_messages"] = []  
-                        save_user_data(data)
+                        with store.edit(user_id) as user_data:
+                            deleted_posts = user_data["post_messages"]
+                            user_data["post_messages"] = []  
 
                         await update.message.reply_text(f"All done! 🧹 I've cleared all {len(deleted_posts)} posts for you ✨", parse_mode="Markdown")
                     except Exception as e:
@@ -243,24 +343,22 @@ async def delpost(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
                 post_message = ' '.join(context.args)
 
-                data = load_user_data()
-
-                if user_id in data["users"] and "post_messages" in data["users"][user_id]:
+                if "post_messages" in store.get_user(user_id):
                     try:
-                        post_messages = data["users"][user_id]["post_messages"]
+                        post_messages = store.get_user(user_id)["post_messages"]
 
                         if post_message in post_messages:
 
-                            post_messages.remove(post_message)
-                            save_user_data(data)
+                            with store.edit(user_id):
+                                post_messages.remove(post_message)
                             await update.message.reply_text(f"Got it! 🗑️ I've deleted this post:\n `{post_message}`", parse_mode="Markdown")
                         else:
 
                             try:
                                 post_index = int(post_message) - 1
                                 if 0 <= post_index < len(post_messages):
-                                    deleted_post = post_messages.pop(post_index)
-                                    save_user_data(data)
+                                    with store.edit(user_id):
+                                        deleted_post = post_messages.pop(post_index)
                                     await update.message.reply_text(f"Done! 🗑️ I've deleted this post:\n `{deleted_post}`", parse_mode="Markdown")
                                 else:
                                     await update.message.reply_text("Oops! 🤔 That post index doesn't exist.")
@@ -280,16 +378,12 @@ async def add(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id_from_message = str(update.message.from_user.id)  
 
     if user_id_from_message in ADMIN_IDS:  
-        data = load_user_data()  
         try:
             user_id = str(context.args[0])
             days = int(context.args[1])
 
             expiry_date = datetime.now() + timedelta(days=days)
 
-            if "users" not in data:
-                data["users"] = {}
-
             default_user_data = {
                 "expiry_date": expiry_date.strftime('%Y-%m-%d %H:%M:%S'),
                 "api_id": "",
@@ -305,12 +399,10 @@ async def add(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 "responder_option": "PM"
             }
 
-            if user_id in data["users"]:
-                data["users"][user_id]["expiry_date"] = expiry_date.strftime('%Y-%m-%d %H:%M:%S')
+            if store.has_user(user_id):
+                store.update_user(user_id, expiry_date=expiry_date.strftime('%Y-%m-%d %H:%M:%S'))
             else:
-                data["users"][user_id] = default_user_data
-
-            save_user_data(data)
+                store.set_user(user_id, default_user_data)
 
             await update.message.reply_text(f"User `{user_id}` added with expiry date: {expiry_date.strftime('%Y-%m-%d %H:%M:%S')}", parse_mode="Markdown")
 
@@ -330,21 +422,13 @@ async def remove(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id_from_message = str(update.message.from_user.id)  
 
     if user_id_from_message in ADMIN_IDS:  
-        data = load_user_data()  
         try:
             user_id = str(context.args[0])  
 
-            if user_id in data["users"]:
-
-                await stop_telethon_client(user_id)
+            if store.has_user(user_id):
 
-                session_file = f'{user_id}.session'
-                if os.path.exists(session_file):
-                    os.remove(session_file)
-                    print(f"Deleted session file: {session_file}")
-
-                del data["users"][user_id]
-                save_user_data(data)  
+                await teardown_user(user_id, delete_session=True)
+                print(f"Deleted saved session for user {user_id}")
 
                 await update.message.reply_text(f"User {user_id} removed, Telethon client stopped, and Session file deleted.")
             else:
@@ -362,13 +446,7 @@ async def api_id(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         if len(context.args) == 1:
             api_id = context.args[0]
 
-            data = load_user_data()
-
-            if user_id not in data["users"]:
-                data["users"][user_id] = {}  
-            data["users"][user_id]["api_id"] = api_id
-
-            save_user_data(data)
+            store.update_user(user_id, api_id=api_id)
             await update.message.reply_text("🔑 *API ID successfully saved!* ✅\n\n_Your API ID has been securely stored in our system._", parse_mode="Markdown")
         else:
             await update.message.reply_text("Usage: /api_id <API_ID>")
@@ -381,13 +459,7 @@ async def api_hash(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         if len(context.args) == 1:
             api_hash = context.args[0]
 
-            data = load_user_data()
-
-            if user_id not in data["users"]:
-                data["users"][user_id] = {}  
-            data["users"][user_id]["api_hash"] = api_hash
-
-            save_user_data(data)
+            store.update_user(user_id, api_hash=api_hash)
             await update.message.reply_text("🔑 *API HASH successfully saved!* ✅\n\n_Your API HASH has been securely stored in our system._", parse_mode="Markdown")
         else:
             await update.message.reply_text("Usage:\n `/hash <API_HASH>`", parse_mode="Markdown")
@@ -536,15 +608,13 @@ async def login(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         return 
 
     if await is_authorized(user_id):
-        data = load_user_data()
-        user_data = data["users"].get(user_id, {})
+        user_data = store.get_user(user_id)
 
         api_id = user_data.get("api_id")
         api_hash = user_data.get("api_hash")
 
         if api_id and api_hash:
-            client = TelegramClient(f'{user_id}.session', api_id, api_hash)
-            await client.connect()
+            client = await session_manager.get_client(user_id, require_session=False)
 
             if not await client.is_user_authorized():
                 try:
@@ -568,8 +638,8 @@ async def login(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
                 except Exception as e:
                     await reply(f"❌ *Error:* Failed to send OTP!\n\n_Details: {e}_", parse_mode="Markdown")
             else:
+                session_manager.mark_authorized(user_id)
                 await reply("✅ *You are already logged in!*", parse_mode="Markdown")
-                await client.disconnect()
         else:
             await reply(
                 "⚠️ *Configuration Missing*\n\n"
@@ -621,20 +691,19 @@ async def otp(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         phone_code_hash = context.user_data.get('phone_code_hash')  
 
         if phone_number and phone_code_hash:
-            data = load_user_data()
-            user_data = data["users"].get(user_id, {})
+            user_data = store.get_user(user_id)
 
             api_id = user_data.get("api_id")
             api_hash = user_data.get("api_hash")
 
             if api_id and api_hash:
-                client = TelegramClient(f'{user_id}.session', api_id, api_hash)
-                await client.connect()
+                client = await session_manager.get_client(user_id, require_session=False)
 
                 try:
                     if not await client.is_user_authorized():
                         try:
                             await client.sign_in(phone=phone_number, code=otp_code, phone_code_hash=phone_code_hash)
+                            session_manager.mark_authorized(user_id)
                             await message.reply_text(
                                 "🎉 *Success! Login Complete* ✅\n\n"
                                 "📱 Your account has been successfully authenticated\n"
@@ -675,10 +744,17 @@ async def otp(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
                             "✅ No additional authentication needed\n"
                             "━━━━━━━━━━━━━━━━━━━",
                             parse_mode="Markdown"
-                        )                        
-                        await client.disconnect()
-                finally:
-                    await client.disconnect()
+                        )
+                except Exception as e:
+                    logger.error(f"Error during OTP login for user {user_id}: {e}")
+                    await message.reply_text(
+                        "❌ *Login Failed*\n\n"
+                        f"⚠️ Error: `{str(e)}`\n"
+                        "━━━━━━━━━━━━━━━━━━━\n"
+                        "🔄 Please try again\n"
+                        "━━━━━━━━━━━━━━━━━━━",
+                        parse_mode="Markdown"
+                    )
             else:
                 await message.reply_text("API ID and Hash not found. Set them with\n\n /api_id and /hash.")
         else:
@@ -692,18 +768,17 @@ async def two_fa(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
     if password:
 
-        data = load_user_data()
-        user_data = data["users"].get(user_id, {})
+        user_data = store.get_user(user_id)
 
         api_id = user_data.get("api_id")
         api_hash = user_data.get("api_hash")
 
         if api_id and api_hash:
-            client = TelegramClient(f'{user_id}.session', api_id, api_hash)
-            await client.connect()
+            client = await session_manager.get_client(user_id, require_session=False)
 
             try:
                 await client.sign_in(password=password)
+                session_manager.mark_authorized(user_id)
                 await update.message.reply_text(
                     "✨ *2FA Authentication Successful*\n\n"
                     "🔐 Password verified correctly\n"
@@ -721,9 +796,7 @@ async def two_fa(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
                     "🔄 Please try again with correct password\n"
                     "━━━━━━━━━━━━━━━━━━━",
                     parse_mode="Markdown"
-                )            
-            finally:
-                await client.disconnect()
+                )
         else:
             await update.message.reply_text("API ID and Hash not found. Set them with /api_id and /hash.")
     else:
@@ -742,8 +815,7 @@ async def logout(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
     user_id = str(message.from_user.id)  
 
-    data = load_user_data()
-    user_data = data["users"].get(user_id, {})
+    user_data = store.get_user(user_id)
 
     api_id = user_data.get("api_id")
     api_hash = user_data.get("api_hash")
@@ -751,10 +823,13 @@ async def logout(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if api_id and api_hash:
         try:
 
-            client = TelegramClient(f'{user_id}.session', api_id, api_hash)
+            # The worker holding this account has to disconnect before it can be logged out here
+            if worker_supervisor.enabled and not await worker_supervisor.release(user_id):
+                await message.reply_text("Your account is still busy forwarding. Please try again in a moment.")
+                return
 
             try:
-                await client.connect()
+                client = await session_manager.get_client(user_id, require_session=False)
             except Exception as e:
                 await message.reply_text(f"Failed to connect: {e}")
                 return  
@@ -764,16 +839,11 @@ async def logout(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             except Exception as e:
                 await message.reply_text(f"Failed to log out: {e}")
                 return  
+            finally:
+                worker_supervisor.send(user_id, "close")
+                await session_manager.close(user_id, delete_session=True)
 
-            session_file = f'{user_id}.session'
-            try:
-                if os.path.exists(session_file):
-                    os.remove(session_file)
-                    await message.reply_text("You have been logged out and session file has been deleted.")
-                else:
-                    await message.reply_text("Logout successful ✔")
-            except Exception as e:
-                await message.reply_text(f"Failed to delete session file: {e}")
+            await message.reply_text("You have been logged out and your saved session has been deleted.")
 
         except Exception as e:
             await message.reply_text(f"An unexpected error occurred: {e}")
@@ -782,8 +852,7 @@ async def logout(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 async def list_users(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:  
 
-    data = load_user_data()  
-    users = data.get("users", {})  
+    users = store.users  
     user_id = str(update.message.from_user.id)  
 
     if user_id not in ADMIN_IDS:  
@@ -831,19 +900,15 @@ async def add_group(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             await update.message.reply_text("You can add a maximum of 50 group links at a time.")  
             return  
 
-        with open("config.json", "r") as f:  
-            config_data = json.load(f)  
-
-        user_data = config_data["users"].get(user_id, {})  
-        user_groups = user_data.get("groups", [])  
+        user_groups = list(store.get_user(user_id).get("groups", []))  
 
         added_groups = []  
         already_in_list = []  
 
         for group_link in group_links:  
             group_link = group_link.strip()  
-            # Check if the group link is a valid Telegram link or a chat ID  
-            if group_link.startswith("https://t.me/") or (group_link.startswith('-') and group_link[1:].isdigit()):  
+            # Compile the link once here so the forwarder never has to parse it
+            if parse_destination(group_link) is not None:
                 if group_link and group_link not in user_groups:  
                     user_groups.append(group_link)  
                     added_groups.append(group_link)  
@@ -852,11 +917,7 @@ async def add_group(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             else:  
                 await update.message.reply_text(f"Link '{group_link}' is not a valid Telegram link or chat ID.")  
 
-        user_data["groups"] = user_groups  
-        config_data["users"][user_id] = user_data  
-
-        with open("config.json", "w") as f:  
-            json.dump(config_data, f, indent=4)  
+        store.update_user(user_id, groups=user_groups)  
 
         if added_groups:  
             added_groups_response = "*🎉 Groups Added for Forwarding:*\n"  
@@ -904,11 +965,7 @@ async def del_group(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             removed_groups = []  
             not_found_groups = []  
 
-            with open("config.json", "r") as f:  
-                config_data = json.load(f)  
-
-            user_data = config_data["users"].get(user_id, {})  
-            user_groups = user_data.get("groups", [])  
+            user_groups = list(store.get_user(user_id).get("groups", []))  
 
             for group_id in group_ids:  
                 if group_id in user_groups:  
@@ -917,11 +974,9 @@ async def del_group(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
                 else:  
                     not_found_groups.append(group_id)  
 
-            user_data["groups"] = user_groups  
-            config_data["users"][user_id] = user_data  
-
-            with open("config.json", "w") as f:  
-                json.dump(config_data, f, indent=4)  
+            store.update_user(user_id, groups=user_groups)  
+            for group_id in removed_groups:
+                peer_cache.invalidate(user_id, group_id)
 
             response = ""  
             if removed_groups or not_found_groups:  
@@ -960,15 +1015,7 @@ async def time(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if await is_authorized(user_id):  
         if interval and interval > 0:
 
-            with open("config.json", "r") as f:
-                config_data = json.load(f)
-
-            user_data = config_data["users"].get(user_id, {})
-            user_data["interval"] = interval  
-            config_data["users"][user_id] = user_data  
-
-            with open("config.json", "w") as f:
-                json.dump(config_data, f, indent=4)
+            store.update_user(user_id, interval=interval)
 
             await update.message.reply_text(f"*Message forwarding interval set to {interval} seconds ✅*", parse_mode="Markdown")
         else:
@@ -977,20 +1024,11 @@ async def time(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await update.message.reply_text(f"<b>No Active Subscription, Please contact</b> <a href=\"tg://resolve?domain={ADMIN_USERNAME}\">Admin</a>", parse_mode="HTML")
 
 async def offf(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: str, reason: str = "") -> None:
-    with open("config.json", "r") as f:
-        config_data = json.load(f)
-
-    user_data = config_data["users"].get(user_id, {})
+    user_data = store.get_user(user_id)
     if "forwarding_on" in user_data and user_data["forwarding_on"]:
-        user_data["forwarding_on"] = False
+        store.update_user(user_id, forwarding_on=False)
 
-        with open("config.json", "w") as f:
-            json.dump(config_data, f, indent=4)
-
-        for job in scheduler.get_jobs():
-            if job.args[2] == user_id:
-                scheduler.remove_job(job.id)
-                break
+        await stop_forwarding(user_id)
 
         if update and update.message:
             await update.message.reply_text(
@@ -1012,22 +1050,11 @@ async def off(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         user_id = str(update.message.from_user.id)
         message = update.message
 
-    with open("config.json", "r") as f:
-        config_data = json.load(f)
-
-    user_data = config_data["users"].get(user_id, {})
+    user_data = store.get_user(user_id)
     if "forwarding_on" in user_data and user_data["forwarding_on"]:
-        user_data["forwarding_on"] = False
-        with open("config.json", "w") as f:
-            json.dump(config_data, f, indent=4)
-
-        job_removed = False
-        if scheduler.running:
-            for job in scheduler.get_jobs():
-                if job.args[2] == user_id:  
-                    scheduler.remove_job(job.id)
-                    job_removed = True
-                    break
+        store.update_user(user_id, forwarding_on=False)
+
+        job_removed = await stop_forwarding(user_id)
 
         response_text = "✅ *Message Forwarding Status*\n\n❌ *Forwarding has been disabled*\n└ _Your automated message forwarding service is now turned off_" if job_removed else "ℹ️ *Forwarding Status*\n\n❗ *No Active Service Found*\n└ _There are no running forwarding tasks for your account_"
 
@@ -1036,10 +1063,6 @@ async def off(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         else:
             await message.reply_text(response_text, parse_mode="Markdown")
 
-        if not scheduler.get_jobs():
-            scheduler.shutdown(wait=False)
-            print("Scheduler stopped as there are no remaining jobs.")
-
     else:
         response_text = "*ℹ️ Message forwarding is already disabled or not set up for you ❗*"
         if update.callback_query:
@@ -1061,57 +1084,70 @@ def extract_chat_and_message_id(post_message: str):
             return chat_username, int(message_id)  
     return None, None
 
-def extract_group_and_topic_id(group_link: str):
-    """
-    Extracts the group username and optional topic ID from a group link.
-    Example: https://t.me/groupusername/12345 (for topic links).
-    """
-    if group_link.startswith("https://t.me/"):
-        parts = group_link.replace("https://t.me/", "").split("/")
-        group_username = parts[0]  
+def forwarding_interval(user_id: str) -> int:
+    """Current forwarding period for a user, read on every tick so /time applies to a running worker."""
+    record = store.record(user_id)
+    return (record.interval if record else None) or DEFAULT_INTERVAL
 
-        topic_id = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else None
+async def send_to_groups(update: Update, user_id: str, client, destinations, send) -> None:
+    """Run ``send(destination, target_group)`` for every destination, a few at a time.
 
-        return group_username, topic_id
-    return None, None
+    Sends draw on the account's token bucket. A FloodWaitError pauses the whole
+    account for the requested time, then the same destination is tried again.
+    ``send`` returns False when it had nothing to send.
+    """
+    governor = rate_governor.account(user_id)
+    semaphore = asyncio.Semaphore(rate_governor.concurrency)
+
+    async def deliver(destination):
+        group_link = destination.link
+        async with semaphore:
+            while True:
+                await governor.acquire()
+                started = monotonic()
+                try:
+                    target_group = await peer_cache.resolve(client, user_id, destination)
+                    if await send(destination, target_group):
+                        await track_forward(user_id, True, group_link, monotonic() - started)
+                    return
+                except FloodWaitError as e:
+                    print(f"Flood wait of {e.seconds}s while sending to {group_link}, pausing user {user_id}")
+                    governor.pause(e.seconds)
+                except Exception as e:
+                    if isinstance(e, PEER_ERRORS):
+                        peer_cache.invalidate(user_id, group_link)
+                    error = f"⚠️ Error forwarding message to {group_link}\n\n🔴 Error: {e}"
+                    error_message = f"⚠️ Error forwarding message:\n\n📎 Group: `{group_link}`\n\n🔴 Error: `{e}`"
+                    print(error)
+                    await track_forward(user_id, False, group_link, monotonic() - started)
+                    if update and update.message:
+                        await update.message.reply_text(error_message, parse_mode="Markdown")
+                    await asyncio.sleep(0.5)
+                    return
+
+    await asyncio.gather(*(deliver(destination) for destination in destinations))
 
 async def forward_messages(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: str) -> None:
     try:
 
-        with open("config.json", "r") as f:
-            config_data = json.load(f)
-
-        user_data = config_data["users"].get(user_id, {})
-        api_id = user_data.get('api_id', '')
-        api_hash = user_data.get('api_hash', '')
-        post_message = user_data.get('post_messages', [])
-        interval = int(user_data.get('interval', 60))  
-        user_groups = user_data.get('groups', [])
-        forwarding_on = user_data.get('forwarding_on', False)
-        session_file = f'{user_id}.session'
-        message_target = user_data.get('message_target', 'groups')
-
-        async with session_lock:
-            client = TelegramClient(session_file, api_id, api_hash)
-            await client.connect()
-
-            if not await client.is_user_authorized():
-                await client.disconnect()
-                if os.path.exists(session_file):
-                    os.remove(session_file)
-                await offf(update, context, user_id, reason="Your session was terminated. Please log in again ❌")
-                print(f"Session was terminated for user {user_id}")
-                return
-            print(f"User {user_id} is authorized")
-            await client.disconnect()
-            await asyncio.sleep(0.8)
+        record = store.record(user_id)
+        if record is None:
+            print(f"User {user_id} no longer exists, skipping forwarding.")
+            return
+        post_message = record.post_messages
+        forwarding_on = record.forwarding_on
+        message_target = record.message_target
+
+        if not await session_manager.is_authorized(user_id):
+            await session_manager.close(user_id, delete_session=True)
+            await offf(update, context, user_id, reason="Your session was terminated. Please log in again ❌")
+            print(f"Session was terminated for user {user_id}")
+            return
+        print(f"User {user_id} is authorized")
         if message_target == 'groups':
-            destinations = user_data.get('groups', [])
+            destinations = record.destinations
         else:  # scraped users
-            scraped_groups = user_data.get('scraped_groups', {})
-            destinations = []
-            for group_members in scraped_groups.values():
-                destinations.extend(group_members)
+            destinations = scraped_store.all_members(user_id, record.scraped_groups)
         if not forwarding_on:
             print("Forwarding is disabled for this user.")
             await offf(update, context, user_id, reason="Forwarding is disabled")
@@ -1125,144 +1161,106 @@ async def forward_messages(update: Update, context: ContextTypes.DEFAULT_TYPE, u
             await offf(update, context, user_id, reason="No post messages available for forwarding ❌")
             return
 
-        post_index = user_data.get("post_index", 0)
+        post_index = record.post_index
         if post_index >= len(post_message):  
             post_index = 0
             
         if message_target == 'scraped':
-            async with TelegramClient(session_file, api_id, api_hash) as client:
-                post_messages = user_data.get('post_messages', [])
+            async with session_manager.lease(user_id) as client:
+                post_messages = record.post_messages
                 if not post_messages:
                     return
                 current_post = post_messages[post_index]
+                from_peer, message_id = extract_chat_and_message_id(current_post)
+                is_link = current_post.startswith("https://t.me/")
+
+                # One fetch of the source post for the whole rotation, however long it takes
+                source_message = None
+                if is_link and from_peer and message_id:
+                    try:
+                        source_message = await client.get_messages(from_peer, ids=message_id)
+                    except Exception as e:
+                        print(f"Failed to fetch source post {current_post}: {e}")
+                        return
+                    if source_message is None:
+                        await offf(update, context, user_id, reason=f"Source post not found: {current_post}")
+                        return
                 
-                scraped_groups = user_data.get('scraped_groups', {})
-                destinations = []
-                for group_data in scraped_groups.values():
-                    destinations.extend(group_data['members'])
-                    
                 print(f"Starting to forward messages to {len(destinations)} users")
                 
                 for user_to_message in destinations:
+                    started = monotonic()
                     try:
-                        if current_post.startswith("https://t.me/"):
-                            from_peer, message_id = extract_chat_and_message_id(current_post)
-                            if from_peer and message_id:
-                                message = await client.get_messages(from_peer, ids=message_id)
-                                await client.send_message(int(user_to_message), message)
+                        if is_link:
+                            if source_message is not None:
+                                await client.send_message(int(user_to_message), source_message)
                             else:
                                 await client.send_message(int(user_to_message), current_post)
                         else:
                             await client.send_message(int(user_to_message), current_post, parse_mode='html')
                         
                         print(f"✅ Successfully sent message to user {user_to_message}")
-                        await track_forward(user_id, True, user_to_message)
+                        await track_forward(user_id, True, user_to_message, monotonic() - started)
                         await asyncio.sleep(2)
 
                     except ValueError as ve:
                         print(f"Invalid user ID format: {user_to_message}")
-                        await track_forward(user_id, False, user_to_message)
+                        await track_forward(user_id, False, user_to_message, monotonic() - started)
                     except PeerFloodError:
                         print(f"Too many requests to message users. Cooling down...")
                         await asyncio.sleep(60)
                     except UserPrivacyRestrictedError:
                         print(f"User {user_to_message} has privacy restrictions")
-                        await track_forward(user_id, False, user_to_message)
+                        await track_forward(user_id, False, user_to_message, monotonic() - started)
                     except UserIsBlockedError:
                         print(f"User {user_to_message} has blocked the bot")
-                        await track_forward(user_id, False, user_to_message)
+                        await track_forward(user_id, False, user_to_message, monotonic() - started)
                     except Exception as e:
                         print(f"Error messaging user {user_to_message}: {str(e)}")
-                        await track_forward(user_id, False, user_to_message)
+                        await track_forward(user_id, False, user_to_message, monotonic() - started)
                 
                 print("✅ Completed sending messages to all scraped users")
                 await offf(update, context, user_id, reason="Message forwarding to all scraped users completed ✅")
 
         else:
-            async with TelegramClient(f'{user_id}.session', api_id, api_hash) as client:  
+            async with session_manager.lease(user_id) as client:
                 current_post = post_message[post_index]  
-                for group_link in user_groups:  
-                    while True:  
-                        try:  
-                            if group_link.startswith("https://t.me/"):  
-                                to_peer, topic_id = extract_group_and_topic_id(group_link)  
-                            elif group_link.startswith('-') and group_link[1:].isdigit():  
-                                to_peer = int(group_link)
-                                topic_id = None   
-                            else:  
-                                print(f"Invalid group link: {group_link}")  
-                                break  
-
-                            if current_post.startswith("https://t.me/"):  
-                                from_peer, message_id = extract_chat_and_message_id(current_post)  
-
-                                if "t.me/+" in group_link:   
-                                    target_group = await client(functions.messages.CheckChatInviteRequest(  
-                                        hash=group_link.split('+')[1]  
-                                    ))  
-                                    target_group = target_group.chat  
-                                else:  
-                                    if to_peer:  
-                                        target_group = await client.get_entity(to_peer)  
-                                    else:  
-                                        print(f"Invalid group link: {group_link}")  
-                                        break  
-
-                                if from_peer and message_id:  
-                                    if topic_id:  
-                                        await client(functions.messages.ForwardMessagesRequest(  
-                                            from_peer=from_peer,  
-                                            id=[message_id],  
-                                            to_peer=target_group,  
-                                            top_msg_id=int(topic_id)
-                                        
-                                        ))  
-                                    else:  
-                                        await client(functions.messages.ForwardMessagesRequest(  
-                                            from_peer=from_peer,  
-                                            id=[message_id],  
-                                            to_peer=target_group  
-                                        ))  
-
-                                    print(f"Message forwarded to group {group_link}.")  
-                                else:  
-                                    print(f"Invalid Telegram message link: {current_post}")  
-
-                            else:  
-                                if "t.me/+" in group_link:  
-                                    target_group = await client(functions.messages.CheckChatInviteRequest(  
-                                        hash=group_link.split('+')[1]  
-                                    ))  
-                                    target_group = target_group.chat  
-                                else:  
-                                    target_group = await client.get_entity(to_peer)  
-
-                                if topic_id is not None:  
-                                    await client.send_message(target_group, current_post, reply_to=int(topic_id), parse_mode="HTML")  
-                                else:  
-                                    await client.send_message(target_group, current_post, parse_mode="HTML")  
-
-                                print(f"Message sent to group {group_link}.")  
-
-                            await track_forward(user_id, True, group_link)
-                            break  
-                        except Exception as e:
-                            error = f"⚠️ Error forwarding message to {group_link}\n\n🔴 Error: {e}"
-                            error_message = f"⚠️ Error forwarding message:\n\n📎 Group: `{group_link}`\n\n🔴 Error: `{e}`"
-                            print(error)
-                            if update and update.message:
-                                await update.message.reply_text(error_message, parse_mode="Markdown")
-                            await asyncio.sleep(0.5) 
-                            await track_forward(user_id, False, group_link) 
-                            break
-                print(f"All messages sent. Disconnecting client.")
+                from_peer, message_id = extract_chat_and_message_id(current_post)
+                is_link = current_post.startswith("https://t.me/")
+
+                async def send(destination, target_group):
+                    topic_id = destination.topic_id
+                    if is_link:
+                        if topic_id:  
+                            await client(functions.messages.ForwardMessagesRequest(  
+                                from_peer=from_peer,  
+                                id=[message_id],  
+                                to_peer=target_group,  
+                                top_msg_id=int(topic_id)
+                            ))  
+                        else:  
+                            await client(functions.messages.ForwardMessagesRequest(  
+                                from_peer=from_peer,  
+                                id=[message_id],  
+                                to_peer=target_group  
+                            ))  
+                        print(f"Message forwarded to group {destination.link}.")  
+                    else:  
+                        if topic_id is not None:  
+                            await client.send_message(target_group, current_post, reply_to=int(topic_id), parse_mode="HTML")  
+                        else:  
+                            await client.send_message(target_group, current_post, parse_mode="HTML")  
+                        print(f"Message sent to group {destination.link}.")  
+                    return True
+
+                if is_link and not (from_peer and message_id):
+                    print(f"Invalid Telegram message link: {current_post}")  
+                else:
+                    await send_to_groups(update, user_id, client, record.destinations, send)
+                print(f"All messages sent.")
 
         post_index = (post_index + 1) % len(post_message)
-        user_data["post_index"] = post_index
-        config_data["users"][user_id] = user_data  
-        with open("config.json", "w") as f:
-            json.dump(config_data, f, indent=4)
-        await asyncio.sleep(interval)  
+        store.update_user(user_id, post_index=post_index)
     except asyncio.CancelledError:
         print(f"Message forwarding for user {user_id} was canceled.")
         return 
@@ -1272,32 +1270,19 @@ async def forward_messages(update: Update, context: ContextTypes.DEFAULT_TYPE, u
 
 async def forward_saved(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: str) -> None:
     try:
-        with open("config.json", "r") as f:
-            config_data = json.load(f)
-
-        user_data = config_data["users"].get(user_id, {})
-        api_id = user_data.get('api_id', '')
-        api_hash = user_data.get('api_hash', '')
-        interval = int(user_data.get('interval', 60))
-        user_groups = user_data.get('groups', [])
-        forwarding_on = user_data.get('forwarding_on', False)
-        session_file = f'{user_id}.session'
-        message_target = user_data.get('message_target', 'groups')
-
-        async with session_lock:
-            client = TelegramClient(session_file, api_id, api_hash)
-            await client.connect()
+        record = store.record(user_id)
+        if record is None:
+            print(f"User {user_id} no longer exists, skipping forwarding.")
+            return
+        forwarding_on = record.forwarding_on
+        message_target = record.message_target
 
-            if not await client.is_user_authorized():
-                await client.disconnect()
-                if os.path.exists(session_file):
-                    os.remove(session_file)
-                await offf(update, context, user_id, reason="Your session was terminated. Please log in again ❌")
-                print(f"Session was terminated for user {user_id}")
-                return
-            print(f"User {user_id} is authorized")
-            await client.disconnect()
-            await asyncio.sleep(0.8)
+        if not await session_manager.is_authorized(user_id):
+            await session_manager.close(user_id, delete_session=True)
+            await offf(update, context, user_id, reason="Your session was terminated. Please log in again ❌")
+            print(f"Session was terminated for user {user_id}")
+            return
+        print(f"User {user_id} is authorized")
 
         if not forwarding_on:
             print(f"Forwarding is disabled for {user_id}")
@@ -1305,22 +1290,16 @@ async def forward_saved(update: Update, context: ContextTypes.DEFAULT_TYPE, user
             return  
 
         if message_target == 'groups':
-            destinations = user_groups
+            destinations = record.destinations
         else:  
-            scraped_groups = user_data.get('scraped_groups', {})
-            destinations = []
-            for group_data in scraped_groups.values():
-                destinations.extend(group_data.get('members', []))
+            destinations = scraped_store.all_members(user_id, record.scraped_groups)
 
         if not destinations:
             print(f"No {message_target} found for this user.")
             await offf(update, context, user_id, reason=f"No {message_target} found for forwarding ❌")
             return
 
-        async with TelegramClient(f'{user_id}.session', api_id, api_hash) as client:
-            if not await client.is_user_authorized():
-                print("User is not authorized.")
-                return
+        async with session_manager.lease(user_id) as client:
 
             saved_messages = await client.get_entity('me')
             messages = await client.get_messages(saved_messages, limit=1)  
@@ -1337,6 +1316,7 @@ async def forward_saved(update: Update, context: ContextTypes.DEFAULT_TYPE, user
 
             if message_target == 'scraped':
                 for user_to_message in destinations:
+                    started = monotonic()
                     try:
                         if current_post.text:
                             await client.send_message(int(user_to_message), current_post.text, parse_mode='html')
@@ -1344,13 +1324,13 @@ async def forward_saved(update: Update, context: ContextTypes.DEFAULT_TYPE, user
                             await client.send_file(int(user_to_message), current_post.media)
                         
                         print(f"✅ Successfully sent message to user {user_to_message}")
-                        await track_forward(user_id, True, user_to_message)
+                        await track_forward(user_id, True, user_to_message, monotonic() - started)
                         success_count += 1
                         await asyncio.sleep(1)
 
                     except ValueError as ve:
                         print(f"Invalid user ID format: {user_to_message}\n\nError ❌:\n{ve}")
-                        await track_forward(user_id, False, user_to_message)
+                        await track_forward(user_id, False, user_to_message, monotonic() - started)
                         failed_count += 1
                         errors.append(f"Invalid user ID: {user_to_message}")
                     except PeerFloodError:
@@ -1359,17 +1339,17 @@ async def forward_saved(update: Update, context: ContextTypes.DEFAULT_TYPE, user
                         errors.append("PeerFloodError")
                     except UserPrivacyRestrictedError:
                         print(f"User {user_to_message} has privacy restrictions")
-                        await track_forward(user_id, False, user_to_message)
+                        await track_forward(user_id, False, user_to_message, monotonic() - started)
                         failed_count += 1
                         errors.append(f"Privacy restrictions: {user_to_message}")
                     except UserIsBlockedError:
                         print(f"User {user_to_message} has blocked the bot")
-                        await track_forward(user_id, False, user_to_message)
+                        await track_forward(user_id, False, user_to_message, monotonic() - started)
                         failed_count += 1
                         errors.append(f"User blocked: {user_to_message}")
                     except Exception as e:
                         print(f"Error messaging user {user_to_message}: {str(e)}")
-                        await track_forward(user_id, False, user_to_message)
+                        await track_forward(user_id, False, user_to_message, monotonic() - started)
                         failed_count += 1
                         errors.append(f"Error for {user_to_message}: {str(e)}")
                 
@@ -1377,58 +1357,29 @@ async def forward_saved(update: Update, context: ContextTypes.DEFAULT_TYPE, user
                 reason = f"Message forwarding to all scraped users completed ✅\n\nSuccess: {success_count}\n Failed: {failed_count}\n Errors ❌:\n {errors[:5] if errors else 'None'}"
                 await offf(update, context, user_id, reason=reason)
             else:
-                for group_link in destinations:
-                    retry_count = 1
-                    while retry_count > 0:
-                        try:
-                            if group_link.startswith('-') and group_link[1:].isdigit():  
-                                to_peer = int(group_link)  
-                                target_group = await client.get_entity(to_peer)
-                                topic_id = None  
-                            else:
-                                to_peer, topic_id = extract_group_and_topic_id(group_link)
-                                if "t.me/+" in group_link:  
-                                    target_group = await client(functions.messages.CheckChatInviteRequest(
-                                        hash=group_link.split('+')[1]
-                                    ))
-                                    target_group = target_group.chat
-                                else:
-                                    target_group = await client.get_entity(to_peer)
-
-                            if current_post.text or current_post.media:
-                                if topic_id is not None:
-                                    await client(functions.messages.ForwardMessagesRequest(
-                                        from_peer=saved_messages,
-                                        id=[current_post.id],
-                                        to_peer=target_group,
-                                        top_msg_id=int(topic_id)
-                                    ))
-                                else:
-                                    await client(functions.messages.ForwardMessagesRequest(
-                                        from_peer=saved_messages,
-                                        id=[current_post.id],
-                                        to_peer=target_group
-                                    ))
-                                print(f"Message forwarded to group {group_link}.")
-                                await track_forward(user_id, True, group_link)
-                            else:
-                                print(f"Message does not contain text or media, skipping: {current_post.id}")
-                            
-                            break  
-                           
-                        except Exception as e:
-                            error = f"⚠️ Error forwarding message to {group_link}\n\n🔴 Error: {e}"
-                            error_message = f"⚠️ Error forwarding message:\n\n📎 Group: `{group_link}`\n\n🔴 Error: `{e}`"
-                            print(error)
-                            if update and update.message:
-                                await update.message.reply_text(error_message, parse_mode="Markdown")
-                            await asyncio.sleep(0.5)  
-                            await track_forward(user_id, False, group_link) 
-                            break       
+                async def send(destination, target_group):
+                    if not (current_post.text or current_post.media):
+                        print(f"Message does not contain text or media, skipping: {current_post.id}")
+                        return False
+                    if destination.topic_id is not None:
+                        await client(functions.messages.ForwardMessagesRequest(
+                            from_peer=saved_messages,
+                            id=[current_post.id],
+                            to_peer=target_group,
+                            top_msg_id=int(destination.topic_id)
+                        ))
+                    else:
+                        await client(functions.messages.ForwardMessagesRequest(
+                            from_peer=saved_messages,
+                            id=[current_post.id],
+                            to_peer=target_group
+                        ))
+                    print(f"Message forwarded to group {destination.link}.")
+                    return True
+
+                await send_to_groups(update, user_id, client, destinations, send)
                             
-            print(f"All messages sent. Disconnecting client.")
-        
-        await asyncio.sleep(interval)
+            print(f"All messages sent.")
     except asyncio.CancelledError:
         print(f"Message forwarding for user {user_id} was canceled.")
         return 
@@ -1456,8 +1407,7 @@ async def on(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         )
         return
 
-    data = load_user_data()
-    user_data = data["users"].get(user_id, {})
+    user_data = store.get_user(user_id)
     message_source = user_data.get("message_source", "mypost")
     message_target = user_data.get('message_target', 'groups')
 
@@ -1466,10 +1416,7 @@ async def on(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if message_target == 'groups':
             destinations = user_data.get('groups', [])
     else:  
-            scraped_groups = user_data.get('scraped_groups', {})
-            destinations = []
-            for group_members in scraped_groups.values():
-                destinations.extend(group_members)
+            destinations = scraped_store.member_count(user_data.get('scraped_groups', {}))
 
     if user_data.get("forwarding_on", False):
         await (message.edit_text if is_callback else message.reply_text)("*Forwarding cannot be toggled twice ❌*", parse_mode="Markdown")
@@ -1501,48 +1448,25 @@ async def on(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         )
         return
 
-    session_file = f'{user_id}.session'
-    if not os.path.exists(session_file):
+    if not session_manager.has_session(user_id):
         await (message.edit_text if is_callback else message.reply_text)("*Sorry, you are logged out. Please log in again with* `/login +1234567890`", parse_mode="Markdown")
         return
 
     try:
-        client = TelegramClient(session_file, user_data["api_id"], user_data["api_hash"])
-        await client.connect()  
-
-        if not await client.is_user_authorized():
-            await client.disconnect()
-            os.remove(session_file)
+        if not await session_manager.is_authorized(user_id, force=True):
+            await session_manager.close(user_id, delete_session=True)
             await (message.edit_text if is_callback else message.reply_text)("*Your session was terminated. Please log in again ❌*", parse_mode="Markdown")
             return
 
-        data["users"][user_id]["forwarding_on"] = True
-        save_user_data(data)
+        store.update_user(user_id, forwarding_on=True)
 
-        if not scheduler.running:
-            scheduler.start()
-
-        job_exists = any(job.args[0] == user_id for job in scheduler.get_jobs())
-        if not job_exists:
-            if message_source == "saved_messages":
-                scheduler.add_job(forward_saved, 'interval', seconds=int(user_data["interval"]), args=[update, context, user_id], max_instances=10)
-            else:
-                scheduler.add_job(forward_messages, 'interval', seconds=int(user_data["interval"]), args=[update, context, user_id], max_instances=10)
+        await start_forwarding(user_id, update, context)
 
         await (message.edit_text if is_callback else message.reply_text)("*Message forwarding is now enabled ✅*", parse_mode="Markdown")
 
     except Exception as e:
         print(f"An error occurred while checking your session: {e}")
         await (message.edit_text if is_callback else message.reply_text)(f"*An error occurred while checking your session.\n{e}❗*", parse_mode="Markdown")
-    finally:
-        if client.is_connected():
-            await client.disconnect()
-
-    await asyncio.sleep(1)
-    if message_source == "saved_messages":
-        asyncio.create_task(forward_saved(update, context, user_id))  
-    else:
-        asyncio.create_task(forward_messages(update, context, user_id))
 
 async def settings(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
@@ -1555,10 +1479,8 @@ async def settings(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         user_id = str(update.message.from_user.id)
         is_callback = False
 
-    with open("config.json", "r") as f:
-        config_data = json.load(f)
     if await is_authorized(user_id):
-        user_data = config_data["users"].get(user_id, {})
+        user_data = store.get_user(user_id)
         user_groups = user_data.get('groups', [])
         interval = user_data.get('interval', "Not set")
         forwarding_status = user_data.get('forwarding_on', False)
@@ -1570,7 +1492,7 @@ async def settings(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         else:
             group_info = "No Group has been added"
 
-        session_exists = os.path.exists(f"{user_id}.session")
+        session_exists = session_manager.has_session(user_id)
         settings_text = (
             "*📱 Settings Dashboard*\n\n"
             "*📊 Status Overview:*\n"
@@ -1614,8 +1536,7 @@ async def message_source(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         message = update.message
         is_callback = False
 
-    data = load_user_data()
-    user_data = data["users"].get(user_id, {})
+    user_data = store.get_user(user_id)
 
     current_source = user_data.get("message_source", "mypost")
 
@@ -1661,10 +1582,7 @@ async def my_posts(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         message = update.message
         is_callback = False
 
-    with open("config.json", "r") as f:
-        config_data = json.load(f)
-
-    user_data = config_data["users"].get(user_id, {})
+    user_data = store.get_user(user_id)
     post_messages = user_data.get('post_messages', [])
 
     if post_messages:
@@ -1696,10 +1614,7 @@ async def my_groups(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         message = update.message
         is_callback = False
 
-    with open("config.json", "r") as f:
-        config_data = json.load(f)
-
-    user_data = config_data["users"].get(user_id, {})
+    user_data = store.get_user(user_id)
     user_groups = user_data.get('groups', [])
 
     if user_groups:
@@ -1775,8 +1690,7 @@ async def keywords_command(update, context):
     else:
         user_id = str(update.message.from_user.id)  
 
-    data = load_user_data()
-    user_data = data["users"].get(user_id, {})
+    user_data = store.get_user(user_id)
 
     response_text = get_user_keywords(user_data)
 
@@ -1835,8 +1749,7 @@ async def stopword_command(update, context):
     """
     user_id = str(update.message.from_user.id)  
 
-    data = load_user_data()
-    user_data = data["users"].get(user_id, {})
+    user_data = store.get_user(user_id)
 
     try:
         keyword_to_remove = ' '.join(context.args)  
@@ -1854,9 +1767,8 @@ async def stopword_command(update, context):
         await message.edit_text("🔄 <b>Just a moment...</b>", parse_mode="HTML")
         await asyncio.sleep(0.4)
 
-        del keywords[keyword_to_remove]
-
-        save_user_data(data)
+        with store.edit(user_id) as user_data:
+            user_data.get("keywords", {}).pop(keyword_to_remove, None)
 
         await message.edit_text(f"✨ <b>Success! '{keyword_to_remove}' has been removed from your keywords!</b> 🎉", parse_mode="HTML")
     else:
@@ -1868,8 +1780,7 @@ async def autoreply_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return
 
     user_id = str(query.from_user.id).strip()
-    data = load_user_data()
-    user_data = data["users"].get(user_id, {})
+    user_data = store.get_user(user_id)
 
     if not await is_authorized(user_id):
         await query.edit_message_text("*You are not allowed to use this feature ❌*", parse_mode="Markdown")
@@ -1947,34 +1858,31 @@ async def autoreply_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return 
 
     elif query.data == "set_exact":
-        user_data["match_option"] = "exact"
+        store.update_user(user_id, match_option="exact")
     elif query.data == "set_pm":
-        user_data["responder_option"] = "PM"
+        store.update_user(user_id, responder_option="PM")
     elif query.data == "set_gc":
-        user_data["responder_option"] = "GC"
+        store.update_user(user_id, responder_option="GC")
     elif query.data == "set_all":
-        user_data["responder_option"] = "All"
+        store.update_user(user_id, responder_option="All")
     elif query.data == "set_partial":
-        user_data["match_option"] = "partial"
+        store.update_user(user_id, match_option="partial")
     elif query.data == "set_case_insensitive":
-        user_data["match_option"] = "case_insensitive"
+        store.update_user(user_id, match_option="case_insensitive")
     elif query.data == "set_saved":
-        user_data["save_location"] = "saved"
+        store.update_user(user_id, save_location="saved")
     elif query.data == "set_chat":
-        user_data["save_location"] = "chat"
+        store.update_user(user_id, save_location="chat")
     elif query.data == "set_deleted_groups":
-        user_data["deleted_monitor_mode"] = "Groups"
-        save_user_data(data)
+        store.update_user(user_id, deleted_monitor_mode="Groups")
         await query.answer("Monitoring deleted messages in groups only", show_alert=True)
         
     elif query.data == "set_deleted_private":
-        user_data["deleted_monitor_mode"] = "Private"
-        save_user_data(data)
+        store.update_user(user_id, deleted_monitor_mode="Private")
         await query.answer("Monitoring deleted messages in private chats only", show_alert=True)
         
     elif query.data == "set_deleted_all":
-        user_data["deleted_monitor_mode"] = "All"
-        save_user_data(data)
+        store.update_user(user_id, deleted_monitor_mode="All")
         await query.answer("Monitoring deleted messages in all chats", show_alert=True)
     elif query.data == "toggle_anti_deleted":
         # Check if deleted_group is set
@@ -1988,8 +1896,7 @@ async def autoreply_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
             )
         else:
             # Toggle the setting
-            user_data["anti_deleted_enabled"] = not user_data.get("anti_deleted_enabled", False)
-            save_user_data(data)
+            user_data = store.update_user(user_id, anti_deleted_enabled=not user_data.get("anti_deleted_enabled", False))
             
             # If they're disabling, we allow it regardless of deleted_group
             # If they're enabling, we already checked for deleted_group above
@@ -2001,13 +1908,12 @@ async def autoreply_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
         if user_data.get("forwarding_on", False):
             await query.answer("Cannot enable auto-reply while forwarding is active", show_alert=True)
             return
-        user_data["auto_reply_status"] = not user_data.get("auto_reply_status", False)
-        save_user_data(data)
+        user_data = store.update_user(user_id, auto_reply_status=not user_data.get("auto_reply_status", False))
         try:
             if user_data["auto_reply_status"]:
-                await start_telethon_client(user_id, context)
+                await start_autoreply(user_id, context)
             else:
-                await stop_telethon_client(user_id)
+                await stop_autoreply(user_id)
             await query.answer(
                 f"Auto-reply is now {'enabled' if user_data['auto_reply_status'] else 'disabled'} ✅",
                 show_alert=True
@@ -2022,8 +1928,7 @@ async def autoreply_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await all_callback(update, context)
         return
 
-    save_user_data(data)
-
+    user_data = store.get_user(user_id)
     match_option = user_data.get("match_option", "exact")
     auto_reply_status = "𝙴𝚗𝚊𝚋𝚕𝚎𝚍 ✅" if user_data.get("auto_reply_status", False) else "𝙳𝚒𝚜𝚊𝚋𝚕𝚎𝚍 ❌"
     auto_reply_text = "𝙳𝚒𝚜𝚊𝚋𝚕𝚎 🔴" if user_data.get("auto_reply_status", False) else "𝙴𝚗𝚊𝚋𝚕𝚎 🟢"
@@ -2093,8 +1998,7 @@ async def all_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     query = update.callback_query
     await query.answer()
     user_id = str(query.from_user.id).strip()
-    data = load_user_data()
-    user_data = data["users"].get(user_id, {})
+    user_data = store.get_user(user_id)
 
     if not await is_authorized(user_id):
         await query.edit_message_text("*You are not allowed to use this feature ❌*", parse_mode="Markdown")
@@ -2107,9 +2011,8 @@ async def all_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     elif query.data == 'set_time':
         await query.edit_message_text("Please use /time <interval> to set the message interval in seconds only.", reply_markup=back_button())
     elif query.data == 'on_off':
-        data = load_user_data()
         user_id = str(query.from_user.id).strip()
-        user_data = data["users"].get(user_id, {})
+        user_data = store.get_user(user_id)
         forwarding_status = user_data.get("forwarding_on", False)
         
         button_text = "Disable ❌" if forwarding_status else "Enable 🟢"
@@ -2127,9 +2030,8 @@ async def all_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
             parse_mode="HTML"
         )    
     elif query.data == 'toggle_forwarding':
-        data = load_user_data()
         user_id = str(query.from_user.id).strip()
-        user_data = data["users"].get(user_id, {})
+        user_data = store.get_user(user_id)
         current_status = user_data.get("forwarding_on", False)
         
         if current_status:
@@ -2243,9 +2145,7 @@ async def all_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         )
 
     elif query.data == 'mypost':  
-        user_data["message_source"] = "mypost"  
-        data["users"][user_id] = user_data  
-        save_user_data(data)  
+        store.update_user(user_id, message_source="mypost")  
 
         current_source = "My Post"  
         keyboard = [  
@@ -2269,13 +2169,10 @@ async def all_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         await view_scraped(update, context)
     elif query.data in ['target_groups', 'target_scraped']:
         new_target = 'groups' if query.data == 'target_groups' else 'scraped'
-        data["users"][user_id]["message_target"] = new_target
-        save_user_data(data)
+        store.update_user(user_id, message_target=new_target)
         await settings(update, context)
     elif query.data == 'saved_messages':  
-        user_data["message_source"] = "saved_messages"  
-        data["users"][user_id] = user_data  
-        save_user_data(data)  
+        store.update_user(user_id, message_source="saved_messages")  
 
         current_source = "Saved Messages"  
         keyboard = [  
@@ -2304,7 +2201,8 @@ async def get_json(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = str(update.message.from_user.id)
     if user_id in ADMIN_IDS:
         try:
-            with open('config.json', 'r', encoding='utf-8') as file:
+            export_path = store.export()
+            with open(export_path, 'r', encoding='utf-8') as file:
                 await update.message.reply_document(
                     document=file,
                     filename='config.json',
@@ -2323,7 +2221,9 @@ async def set_json(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             if doc.file_name == 'config.json':
                 file = await context.bot.get_file(doc.file_id)
                 try:
-                    await file.download_to_drive('config.json')
+                    raw = await file.download_as_bytearray()
+                    store.replace(json.loads(raw))
+                    scraped_store.migrate_inline_members(store)
                     await update.message.reply_text("✅ Configuration file updated successfully!")
                 except Exception as e:
                     await update.message.reply_text(f"❌ Error updating config file: {str(e)}")
@@ -2367,7 +2267,7 @@ async def restart_service(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                     "If you're using Render, please check your API configuration.",
                     parse_mode="Markdown"
                 )
-        except Exception as e:
+        except Exception:
             await update.message.reply_text(
                 "❌ *This command is for Render hosting users only*\n\n"
                 "If you're using Render, verify your hosting setup and API access.",
@@ -2397,13 +2297,7 @@ async def set_deleted_group(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     group_link = ' '.join(context.args).strip()
     
-    data = load_user_data()
-    if user_id not in data["users"]:
-        data["users"][user_id] = {}
-    
-    data["users"][user_id]["deleted_group"] = group_link
-    data["users"][user_id]["anti_deleted_enabled"] = True
-    save_user_data(data)
+    store.update_user(user_id, deleted_group=group_link, anti_deleted_enabled=True)
     
     await update.message.reply_text(
         f"✅ *Anti-Deleted Messages Setup Complete*\n\n"
@@ -2414,7 +2308,9 @@ async def set_deleted_group(update: Update, context: ContextTypes.DEFAULT_TYPE)
     )
 
 def main():
-    application = Application.builder().token(BOT_TOKEN).build()
+    scraped_store.migrate_inline_members(store)
+    session_vault.import_session_files()
+    application = Application.builder().token(BOT_TOKEN).post_init(post_init).post_shutdown(post_shutdown).build()
 
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("add", add))
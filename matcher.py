@@ -0,0 +1,54 @@
+import re
+from functools import lru_cache
+
+from models import MatchOption
+
+
+class KeywordMatcher:
+    """A user's whole keyword table compiled for one match option.
+
+    ``match`` looks at the message once, whatever the number of keywords, and
+    returns ``(keyword, response)`` for the first keyword found in the text
+    (the earliest entry in the table wins a tie), or None.
+
+    exact: the whole message equals a keyword, ignoring case (a dict lookup).
+    partial: a keyword appears as a whole word, ignoring case.
+    case_insensitive: a keyword appears anywhere, ignoring case.
+    """
+
+    __slots__ = ("match_option", "_exact", "_pattern", "_entries")
+
+    def __init__(self, keywords, match_option):
+        self.match_option = MatchOption.parse(match_option)
+        self._entries = tuple((keyword, response) for keyword, response in keywords if keyword)
+        self._exact = None
+        self._pattern = None
+        if not self._entries:
+            return
+        if self.match_option is MatchOption.EXACT:
+            self._exact = {}
+            for entry in self._entries:
+                self._exact.setdefault(entry[0].lower(), entry)
+            return
+        alternatives = "|".join(f"(?P<k{i}>{re.escape(keyword)})" for i, (keyword, _) in enumerate(self._entries))
+        if self.match_option is MatchOption.PARTIAL:
+            alternatives = rf"\b(?:{alternatives})\b"
+        self._pattern = re.compile(alternatives, re.IGNORECASE)
+
+    def match(self, text):
+        if not text:
+            return None
+        if self._exact is not None:
+            return self._exact.get(text.rstrip("\n").lower())
+        if self._pattern is None:
+            return None
+        found = self._pattern.search(text)
+        if found is None:
+            return None
+        return self._entries[int(found.lastgroup[1:])]
+
+
+@lru_cache(maxsize=1024)
+def compile_matcher(keywords, match_option):
+    """Matcher for a (keywords, match_option) pair, reused until the keyword table or option changes."""
+    return KeywordMatcher(keywords, match_option)
@@ -0,0 +1,108 @@
+import copy
+from collections import namedtuple
+from datetime import datetime
+from enum import Enum
+
+EXPIRY_FORMAT = '%Y-%m-%d %H:%M:%S'
+DEFAULT_INTERVAL = 60
+
+
+class MatchOption(str, Enum):
+    EXACT = "exact"
+    PARTIAL = "partial"
+    CASE_INSENSITIVE = "case_insensitive"
+
+    @classmethod
+    def parse(cls, value):
+        try:
+            return cls(str(value).lower())
+        except ValueError:
+            return cls.EXACT
+
+
+# kind is "id", "username" or "invite"; peer is the int chat id or username
+# (None for invite links, which are resolved through invite_hash)
+Destination = namedtuple("Destination", ["kind", "link", "peer", "topic_id", "invite_hash"])
+
+
+def parse_destination(link):
+    """Compile a stored group entry into the pieces the forwarder needs, or None if it can't be used."""
+    if link.startswith("-") and link[1:].isdigit():
+        return Destination("id", link, int(link), None, None)
+    if link.startswith("https://t.me/"):
+        if "t.me/+" in link:
+            invite_hash = link.split("+", 1)[1].split("/")[0]
+            return Destination("invite", link, None, None, invite_hash) if invite_hash else None
+        parts = link.replace("https://t.me/", "").split("/")
+        if not parts[0]:
+            return None
+        topic_id = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else None
+        return Destination("username", link, parts[0], topic_id, None)
+    return None
+
+
+def _parse_interval(value):
+    if value is None:
+        return DEFAULT_INTERVAL
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_expiry(value):
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, EXPIRY_FORMAT)
+    except (TypeError, ValueError):
+        return None
+
+
+class UserRecord:
+    """Read-only, pre-parsed view of one user's config entry.
+
+    Built once per change by ``ConfigStore.record`` and shared by every reader
+    until the entry is edited again. The underlying dict stays the stored
+    format, so ``to_dict`` hands back exactly what was loaded.
+    """
+
+    __slots__ = (
+        "user_id", "source", "expiry", "interval", "api_id", "api_hash",
+        "groups", "destinations", "post_messages", "post_index",
+        "forwarding_on", "message_source", "message_target",
+        "keywords", "match_option", "auto_reply_status", "responder_option",
+        "scraped_groups",
+    )
+
+    def __init__(self, user_id, source):
+        self.user_id = user_id
+        self.source = source
+        self.expiry = _parse_expiry(source.get("expiry_date"))
+        self.interval = _parse_interval(source.get("interval"))
+        self.api_id = source.get("api_id", "")
+        self.api_hash = source.get("api_hash", "")
+        self.groups = tuple(source.get("groups", ()))
+        # Links that don't compile were rejected by /addgroup; older entries are skipped
+        self.destinations = tuple(d for d in map(parse_destination, self.groups) if d is not None)
+        self.post_messages = tuple(source.get("post_messages", ()))
+        self.post_index = source.get("post_index", 0)
+        self.forwarding_on = source.get("forwarding_on", False)
+        self.message_source = source.get("message_source", "mypost")
+        self.message_target = source.get("message_target", "groups")
+        self.keywords = tuple(source.get("keywords", {}).items())
+        self.match_option = MatchOption.parse(source.get("match_option", "exact"))
+        self.auto_reply_status = source.get("auto_reply_status", False)
+        self.responder_option = source.get("responder_option", "PM")
+        self.scraped_groups = source.get("scraped_groups", {})
+
+    @classmethod
+    def from_dict(cls, user_id, data):
+        return cls(user_id, copy.deepcopy(data))
+
+    def to_dict(self):
+        return copy.deepcopy(self.source)
+
+    def get(self, key, default=None):
+        """Fallback for fields the model doesn't cover."""
+        return self.source.get(key, default)
@@ -0,0 +1,129 @@
+import atexit
+import logging
+import os
+import threading
+
+from telethon import functions, utils
+from telethon.errors import (
+    ChannelInvalidError,
+    ChannelPrivateError,
+    ChatIdInvalidError,
+    PeerIdInvalidError,
+)
+from telethon.tl.types import InputPeerChannel, InputPeerChat, InputPeerUser
+
+import serializer
+
+PEER_CACHE_FILE = os.getenv("PEER_CACHE_FILE", "peer_cache.json")
+# Seconds to wait before writing new cache entries to disk
+PEER_CACHE_FLUSH_DELAY = float(os.getenv("PEER_CACHE_FLUSH_DELAY", "10"))
+
+# Errors meaning the stored peer no longer points at a chat we can use
+PEER_ERRORS = (PeerIdInvalidError, ChannelInvalidError, ChannelPrivateError, ChatIdInvalidError)
+
+logger = logging.getLogger(__name__)
+
+
+def _encode(peer):
+    if isinstance(peer, InputPeerChannel):
+        return {"type": "channel", "id": peer.channel_id, "access_hash": peer.access_hash}
+    if isinstance(peer, InputPeerChat):
+        return {"type": "chat", "id": peer.chat_id}
+    if isinstance(peer, InputPeerUser):
+        return {"type": "user", "id": peer.user_id, "access_hash": peer.access_hash}
+    return None
+
+
+def _decode(entry):
+    if entry["type"] == "channel":
+        return InputPeerChannel(entry["id"], entry["access_hash"])
+    if entry["type"] == "chat":
+        return InputPeerChat(entry["id"])
+    return InputPeerUser(entry["id"], entry["access_hash"])
+
+
+class PeerCache:
+    """Per-user map from a destination link to its resolved InputPeer, kept across restarts.
+
+    Entries are only dropped through ``invalidate`` (on a peer error) or when the
+    group/user goes away, so a warm cache needs no lookup RPCs at send time.
+    """
+
+    def __init__(self, path=PEER_CACHE_FILE, flush_delay=PEER_CACHE_FLUSH_DELAY):
+        self.path = path
+        self.flush_delay = flush_delay
+        self._lock = threading.Lock()
+        # Serializes file writes (debounce timer vs. atexit), which happen outside self._lock
+        self._write_lock = threading.Lock()
+        self._timer = None
+        self._dirty = False
+        self._peers = {}
+        try:
+            data = serializer.read_file(path)
+        except FileNotFoundError:
+            data = {}
+        except ValueError as e:
+            logger.error(f"Could not parse {path}: {e}")
+            data = {}
+        for user_id, entries in data.items():
+            self._peers[user_id] = {link: _decode(entry) for link, entry in entries.items()}
+
+    def get(self, user_id, link):
+        return self._peers.get(user_id, {}).get(link)
+
+    def put(self, user_id, link, peer):
+        if _encode(peer) is None:
+            return
+        with self._lock:
+            self._peers.setdefault(user_id, {})[link] = peer
+            self._mark_dirty()
+
+    def invalidate(self, user_id, link):
+        with self._lock:
+            if self._peers.get(user_id, {}).pop(link, None) is not None:
+                self._mark_dirty()
+
+    def drop_user(self, user_id):
+        with self._lock:
+            if self._peers.pop(user_id, None) is not None:
+                self._mark_dirty()
+
+    def _mark_dirty(self):
+        self._dirty = True
+        if self._timer is None:
+            self._timer = threading.Timer(self.flush_delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        with self._write_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                if not self._dirty:
+                    return
+                data = {
+                    user_id: {link: _encode(peer) for link, peer in entries.items()}
+                    for user_id, entries in self._peers.items() if entries
+                }
+                self._dirty = False
+            serializer.write_file(self.path, data)
+
+    async def resolve(self, client, user_id, destination):
+        """Return the InputPeer for a compiled Destination, asking Telegram only on a cache miss."""
+        peer = self.get(user_id, destination.link)
+        if peer is not None:
+            return peer
+        if destination.kind == "invite":
+            invite = await client(functions.messages.CheckChatInviteRequest(hash=destination.invite_hash))
+            entity = invite.chat
+        else:
+            entity = await client.get_entity(destination.peer)
+        peer = utils.get_input_peer(entity)
+        self.put(user_id, destination.link, peer)
+        return peer
+
+
+peer_cache = PeerCache()
+atexit.register(peer_cache.flush)
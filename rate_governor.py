@@ -0,0 +1,73 @@
+import asyncio
+import logging
+import os
+import time
+
+# How many groups one account sends to at the same time
+FORWARD_CONCURRENCY = int(os.getenv("FORWARD_CONCURRENCY", "3"))
+# Sustained sends per second allowed for one account, and how many may go out back to back
+FORWARD_RATE = float(os.getenv("FORWARD_RATE", "1"))
+FORWARD_BURST = int(os.getenv("FORWARD_BURST", "3"))
+
+logger = logging.getLogger(__name__)
+
+
+class AccountGovernor:
+    """Token bucket for one Telegram account, which a FloodWait can pause outright."""
+
+    def __init__(self, rate=FORWARD_RATE, burst=FORWARD_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait until the account may send one more request."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds):
+        """Hold every send for this account for ``seconds`` (the FloodWaitError value)."""
+        until = time.monotonic() + seconds
+        if until > self._paused_until:
+            logger.warning(f"Flood wait: pausing account for {seconds}s")
+            self._paused_until = until
+            self._tokens = 0.0
+
+    @property
+    def paused_for(self):
+        return max(0.0, self._paused_until - time.monotonic())
+
+
+class RateGovernor:
+    """Hands out one AccountGovernor per user so every send path shares the same budget."""
+
+    def __init__(self, rate=FORWARD_RATE, burst=FORWARD_BURST, concurrency=FORWARD_CONCURRENCY):
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = max(1, concurrency)
+        self._accounts = {}
+
+    def account(self, user_id):
+        governor = self._accounts.get(user_id)
+        if governor is None:
+            governor = self._accounts[user_id] = AccountGovernor(self.rate, self.burst)
+        return governor
+
+    def drop_user(self, user_id):
+        self._accounts.pop(user_id, None)
+
+
+rate_governor = RateGovernor()
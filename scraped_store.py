@@ -0,0 +1,113 @@
+import logging
+import os
+import shutil
+import threading
+from array import array
+
+# Scraped member ids live here as <user_id>/<group_id>.ids (packed int64) and .names (one username per line)
+SCRAPED_DIR = os.getenv("SCRAPED_DIR", "scraped")
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_members_cache = {}
+
+
+def _paths(user_id, group_id):
+    base = os.path.join(SCRAPED_DIR, str(user_id), str(group_id))
+    return f"{base}.ids", f"{base}.names"
+
+
+def _write_atomic(path, payload):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(payload)
+    os.replace(tmp_path, path)
+
+
+def save_members(user_id, group_id, members, usernames):
+    """Write a group's scraped ids and usernames; returns the number of ids kept."""
+    ids = array('q', (int(member) for member in members if str(member).lstrip('-').isdigit()))
+    ids_path, names_path = _paths(user_id, group_id)
+    os.makedirs(os.path.dirname(ids_path), exist_ok=True)
+    _write_atomic(ids_path, ids.tobytes())
+    _write_atomic(names_path, "\n".join(usernames).encode("utf-8"))
+    with _lock:
+        _members_cache[(str(user_id), str(group_id))] = ids
+    return len(ids)
+
+
+def load_members(user_id, group_id):
+    """Return the group's member ids as an array('q'), read from disk on first use."""
+    key = (str(user_id), str(group_id))
+    with _lock:
+        ids = _members_cache.get(key)
+    if ids is not None:
+        return ids
+    ids = array('q')
+    ids_path, _ = _paths(user_id, group_id)
+    try:
+        with open(ids_path, "rb") as f:
+            ids.frombytes(f.read())
+    except FileNotFoundError:
+        pass
+    with _lock:
+        _members_cache[key] = ids
+    return ids
+
+
+def load_usernames(user_id, group_id):
+    _, names_path = _paths(user_id, group_id)
+    try:
+        with open(names_path, "r", encoding="utf-8") as f:
+            return [name for name in f.read().split("\n") if name]
+    except FileNotFoundError:
+        return []
+
+
+def all_members(user_id, scraped_groups):
+    """Member ids (as strings) across every scraped group of a user, in group order."""
+    members = []
+    for group_id in scraped_groups:
+        members.extend(str(member) for member in load_members(user_id, group_id))
+    return members
+
+
+def member_count(scraped_groups):
+    return sum(group_data.get("count", 0) for group_data in scraped_groups.values())
+
+
+def remove(user_id, group_id=None):
+    """Delete one scraped group's files, or every group of the user when group_id is None."""
+    with _lock:
+        for key in list(_members_cache):
+            if key[0] == str(user_id) and (group_id is None or key[1] == str(group_id)):
+                del _members_cache[key]
+    if group_id is None:
+        shutil.rmtree(os.path.join(SCRAPED_DIR, str(user_id)), ignore_errors=True)
+        return
+    for path in _paths(user_id, group_id):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def migrate_inline_members(store):
+    """Move member/username lists still embedded in the config out to side files."""
+    moved = 0
+    for user_id in list(store.users):
+        scraped_groups = store.get_user(user_id).get("scraped_groups") or {}
+        inline = [group_id for group_id, group_data in scraped_groups.items()
+                  if "members" in group_data or "usernames" in group_data]
+        if not inline:
+            continue
+        with store.edit(user_id) as record:
+            for group_id in inline:
+                group_data = record["scraped_groups"][group_id]
+                count = save_members(user_id, group_id, group_data.pop("members", []), group_data.pop("usernames", []))
+                group_data["count"] = count
+                moved += 1
+    if moved:
+        logger.info(f"Moved {moved} scraped member lists out of the config into {SCRAPED_DIR}/")
+    return moved
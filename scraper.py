@@ -14,6 +14,9 @@ import re
 import aiohttp
 import io
 from telegram import InputMediaPhoto
+from config_store import store
+from sessions import session_manager
+import scraped_store
 
 async def scrape_members(client, group_id):
     """Scrape members from a group"""
@@ -33,22 +36,14 @@ async def scrape_members(client, group_id):
         return None, None
 
 def save_scraped_members(user_id, group_id, members, group_title, usernames):
-    """Save scraped members to user's data"""
-    with open("config.json", "r") as f:
-        data = json.load(f)
-    
-    if "scraped_groups" not in data["users"][user_id]:
-        data["users"][user_id]["scraped_groups"] = {}
-    
-    data["users"][user_id]["scraped_groups"][group_id] = {
-        "members": members,
-        "title": group_title,
-        "usernames": usernames
-    }
-    data["users"][user_id]["message_target"] = "groups" 
-    
-    with open("config.json", "w") as f:
-        json.dump(data, f, indent=4)
+    """Save scraped members to the side store and their title/count to user's data"""
+    count = scraped_store.save_members(user_id, group_id, members, usernames)
+    with store.edit(user_id) as user_data:
+        user_data.setdefault("scraped_groups", {})[group_id] = {
+            "title": group_title,
+            "count": count
+        }
+        user_data["message_target"] = "groups" 
 
 
 async def handle_scrape(update, context):
@@ -70,27 +65,15 @@ async def handle_scrape(update, context):
 
     group_identifier = context.args[0]
     
-    with open("config.json", "r") as f:
-        data = json.load(f)
-    
-    user_data = data["users"].get(user_id)
-    session_file = f'{user_id}.session'
-
-    if not os.path.exists(session_file):
+    if not session_manager.has_session(user_id):
         await update.message.reply_text("*You need to log in first!*\nUse `/login` command", parse_mode="Markdown")
         return
 
-    client = TelegramClient(session_file, user_data["api_id"], user_data["api_hash"])
-    
     try:
-        if client.is_connected():
-            await client.disconnect()
-            
-        await client.connect()
-        
-        if not await client.is_user_authorized():
+        if not await session_manager.is_authorized(user_id):
             await update.message.reply_text("*Session expired!*\nPlease log in again using `/login`", parse_mode="Markdown")
             return
+        client = await session_manager.get_client(user_id)
 
         progress_msg = await update.message.reply_text("*🔄 Processing group/channel...*", parse_mode="Markdown")
         
@@ -140,24 +123,15 @@ async def handle_scrape(update, context):
             
     except Exception as e:
         await update.message.reply_text(f"❌ *Error:* `{str(e)}`", parse_mode="Markdown")
-    finally:
-        if client.is_connected():
-            await client.disconnect()
 
 async def toggle_target(update, context):
     """Toggle between sending to groups or scraped users"""
     user_id = str(update.message.from_user.id)
     
-    with open("config.json", "r") as f:
-        data = json.load(f)
-        
-    current_target = data["users"][user_id].get("message_target", "groups")
+    current_target = store.get_user(user_id).get("message_target", "groups")
     new_target = "scraped" if current_target == "groups" else "groups"
     
-    data["users"][user_id]["message_target"] = new_target
-    
-    with open("config.json", "w") as f:
-        json.dump(data, f, indent=4)
+    store.update_user(user_id, message_target=new_target)
         
     await update.message.reply_text(f"Message target switched to: {new_target}")
 
@@ -166,10 +140,7 @@ async def view_scraped(update, context):
     query = update.callback_query
     user_id = str(query.from_user.id)
     
-    with open("config.json", "r") as f:
-        data = json.load(f)
-    
-    user_data = data["users"].get(user_id, {})
+    user_data = store.get_user(user_id)
     scraped_groups = user_data.get("scraped_groups", {})
     
     if not scraped_groups:
@@ -190,8 +161,7 @@ async def view_scraped(update, context):
     total_users = 0
     
     for group_id, group_data in scraped_groups.items():
-        members = group_data["members"]
-        user_count = len(members)
+        user_count = group_data.get("count", 0)
         group_title = group_data.get("title", f"Group with {user_count} users")
         total_users += user_count
         message += f"*Group:* `{group_title} || `{group_id}``\n"
@@ -244,10 +214,7 @@ async def remove_scraped(update, context):
 
     target = context.args[0].lower()
     
-    with open("config.json", "r") as f:
-        data = json.load(f)
-    
-    user_data = data["users"].get(user_id, {})
+    user_data = store.get_user(user_id)
     scraped_groups = user_data.get("scraped_groups", {})
     
     if not scraped_groups:
@@ -255,20 +222,19 @@ async def remove_scraped(update, context):
         return
         
     if target == 'all':
-        user_data["scraped_groups"] = {}
+        store.update_user(user_id, scraped_groups={})
+        scraped_store.remove(user_id)
         removed_msg = "✅ *All scraped data has been removed*"
     else:
         if target in scraped_groups:
             group_title = scraped_groups[target].get("title", target)
-            del scraped_groups[target]
+            with store.edit(user_id):
+                del scraped_groups[target]
+            scraped_store.remove(user_id, target)
             removed_msg = f"✅ *Removed scraped data from:*\n`{group_title}`"
         else:
             await update.message.reply_text("❌ *Group ID not found in scraped data*", parse_mode="Markdown")
             return
-    
-    data["users"][user_id] = user_data
-    with open("config.json", "w") as f:
-        json.dump(data, f, indent=4)
         
     await update.message.reply_text(removed_msg, parse_mode="Markdown")
 
@@ -293,35 +259,28 @@ async def add_to_group(update, context):
         scraped_group_id = context.args[0]
         target_group = context.args[1]
         
-        with open("config.json", "r") as f:
-            data = json.load(f)
-        
-        user_data = data["users"].get(user_id)
+        user_data = store.get_user(user_id)
         scraped_groups = user_data.get("scraped_groups", {})
         
         if scraped_group_id not in scraped_groups:
             await progress_msg.edit_text("❌ *Scraped group ID not found*", parse_mode="Markdown")
             return
             
-        session_file = f'{user_id}.session'
-        if not os.path.exists(session_file):
+        if not session_manager.has_session(user_id):
             await progress_msg.edit_text("*You need to log in first!*\nUse `/login` command", parse_mode="Markdown")
             return
 
-        client = TelegramClient(session_file, user_data["api_id"], user_data["api_hash"])
-        
-        await client.connect()
-        if not await client.is_user_authorized():
-            await client.disconnect()
+        if not await session_manager.is_authorized(user_id):
             await progress_msg.edit_text("*Session expired!*\nPlease log in again using `/login`", parse_mode="Markdown")
             return
+        client = await session_manager.get_client(user_id)
 
         target_entity = await get_target_entity(client, target_group)
         if not target_entity:
             await progress_msg.edit_text("❌ *Invalid target group*", parse_mode="Markdown")
             return
         
-        usernames = scraped_groups[scraped_group_id]["usernames"]
+        usernames = scraped_store.load_usernames(user_id, scraped_group_id)
         total_users = len(usernames)
         successful_adds = 0
         failed_adds = 0
@@ -361,9 +320,6 @@ async def add_to_group(update, context):
         
     except Exception as e:
         await progress_msg.edit_text(f"❌ *Error:* `{str(e)}`", parse_mode="Markdown")
-    finally:
-        if 'client' in locals():
-            await client.disconnect()
 
 
 async def get_target_entity(client, target_group):
@@ -442,24 +398,15 @@ async def fetch_collectible(update, context):
     
     progress_msg = await update.message.reply_text("*🔄 Fetching collectible details...*", parse_mode="Markdown")
     
-    with open("config.json", "r") as f:
-        data = json.load(f)
-    
-    user_data = data["users"].get(user_id)
-    session_file = f'{user_id}.session'
-
-    if not os.path.exists(session_file):
+    if not session_manager.has_session(user_id):
         await progress_msg.edit_text("*You need to log in first!*\nUse `/login` command", parse_mode="Markdown")
         return
 
-    client = TelegramClient(session_file, user_data["api_id"], user_data["api_hash"])
-    
     try:
-        await client.connect()
-        
-        if not await client.is_user_authorized():
+        if not await session_manager.is_authorized(user_id):
             await progress_msg.edit_text("*Session expired!*\nPlease log in again using `/login`", parse_mode="Markdown")
             return
+        client = await session_manager.get_client(user_id)
         
         # Get webpage preview to extract collectible details
         response = await client(GetWebPagePreviewRequest(collectible_link))
@@ -529,6 +476,3 @@ async def fetch_collectible(update, context):
     except Exception as e:
         print(f"Error fetching collectible: {str(e)}")
         await progress_msg.edit_text(f"❌ *Error fetching collectible:* `{str(e)}`", parse_mode="Markdown")
-    finally:
-        if client.is_connected():
-            await client.disconnect()
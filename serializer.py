@@ -0,0 +1,57 @@
+"""JSON encoding for everything the bot persists.
+
+Uses orjson when it is installed and the stdlib json module otherwise. Output is
+compact unless ``pretty=True``, which is meant for files people read (the
+/getjson export). Both backends raise ``json.JSONDecodeError`` subclasses on bad input.
+"""
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = "orjson" if orjson else "json"
+
+
+if orjson:
+    _OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj, pretty=False):
+        return orjson.dumps(obj, option=_OPTIONS | orjson.OPT_INDENT_2 if pretty else _OPTIONS)
+
+    def loads(data):
+        return orjson.loads(data)
+else:
+    def dumps(obj, pretty=False):
+        if pretty:
+            return json.dumps(obj, indent=2, ensure_ascii=False).encode("utf-8")
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+    def loads(data):
+        return json.loads(data)
+
+
+def dumps_str(obj, pretty=False):
+    return dumps(obj, pretty).decode("utf-8")
+
+
+def write_file(path, obj, pretty=False, fsync=False):
+    """Serialize ``obj`` to ``path`` via a temp file and rename, so readers never see half a file."""
+    write_bytes(path, dumps(obj, pretty), fsync)
+
+
+def write_bytes(path, payload, fsync=False):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(payload)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_file(path):
+    with open(path, "rb") as f:
+        return loads(f.read())
@@ -0,0 +1,185 @@
+import atexit
+import glob
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from telethon.crypto import AuthKey
+from telethon.sessions import StringSession
+
+import serializer
+
+# One SQLite file (WAL) holding every user's auth key and entity cache
+SESSION_VAULT_FILE = os.getenv("SESSION_VAULT_FILE", "sessions.db")
+# Seconds to collect entity-cache changes before writing them to the vault
+SESSION_FLUSH_DELAY = float(os.getenv("SESSION_FLUSH_DELAY", "30"))
+
+logger = logging.getLogger(__name__)
+
+
+class VaultSession(StringSession):
+    """In-memory Telethon session whose auth key and entities are persisted by the vault.
+
+    A user's row is only created by ``persist`` once the login has succeeded,
+    so an auth key handed out at connect doesn't count as a session yet.
+    """
+
+    def __init__(self, vault, user_id, string=None, entities=()):
+        super().__init__(string)
+        self._vault = vault
+        self._user_id = user_id
+        self._persisted = string is not None
+        self._saved = string or ""
+        self._entities = {tuple(row) for row in entities}
+
+    def save(self):
+        string = super().save()
+        if self._persisted and string and string != self._saved:
+            self._vault.save_auth(self._user_id, string)
+            self._saved = string
+        return string
+
+    @property
+    def persisted(self):
+        return self._persisted
+
+    def persist(self):
+        """Store this session in the vault (called once the user is logged in)."""
+        self._persisted = True
+        self._saved = ""
+        self.save()
+        self._vault.mark_dirty(self._user_id, self)
+
+    def process_entities(self, tlo):
+        # Rows are only ever added, so an unchanged size means nothing new to write
+        before = len(self._entities)
+        super().process_entities(tlo)
+        if self._persisted and len(self._entities) != before:
+            self._vault.mark_dirty(self._user_id, self)
+
+    def close(self):
+        self._vault.flush()
+
+    def delete(self):
+        self._vault.delete(self._user_id)
+
+
+class SessionVault:
+    """Auth keys for every user as StringSession blobs in one indexed table.
+
+    Clients get a ``VaultSession`` built from their row, so there is no
+    per-user .session file to open or lock. Auth keys are written as soon as
+    Telegram hands them out; entity caches are written in batches.
+    """
+
+    def __init__(self, path=SESSION_VAULT_FILE, flush_delay=SESSION_FLUSH_DELAY):
+        self.path = path
+        self.flush_delay = flush_delay
+        self._lock = threading.Lock()
+        self._conn = None
+        self._dirty = {}
+        self._timer = None
+
+    def _db(self):
+        # Caller holds self._lock
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "user_id TEXT PRIMARY KEY, auth TEXT NOT NULL, entities BLOB, updated REAL)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def has(self, user_id):
+        with self._lock:
+            row = self._db().execute("SELECT 1 FROM sessions WHERE user_id = ?", (user_id,)).fetchone()
+        return row is not None
+
+    def session(self, user_id):
+        """Return a VaultSession for ``user_id``; a blank one if the user has never logged in."""
+        with self._lock:
+            row = self._db().execute("SELECT auth, entities FROM sessions WHERE user_id = ?", (user_id,)).fetchone()
+        if row is None:
+            return VaultSession(self, user_id)
+        auth, entities = row
+        return VaultSession(self, user_id, auth, serializer.loads(entities) if entities else ())
+
+    def save_auth(self, user_id, string):
+        with self._lock:
+            conn = self._db()
+            conn.execute(
+                "INSERT INTO sessions (user_id, auth, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET auth = excluded.auth, updated = excluded.updated",
+                (user_id, string, time.time()),
+            )
+            conn.commit()
+
+    def mark_dirty(self, user_id, session):
+        with self._lock:
+            self._dirty[user_id] = session
+            if self._timer is None:
+                self._timer = threading.Timer(self.flush_delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Write pending entity caches in one transaction."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty:
+                return
+            rows = [
+                (serializer.dumps(list(session._entities)), time.time(), user_id)
+                for user_id, session in self._dirty.items()
+            ]
+            self._dirty.clear()
+            conn = self._db()
+            conn.executemany("UPDATE sessions SET entities = ?, updated = ? WHERE user_id = ?", rows)
+            conn.commit()
+
+    def delete(self, user_id):
+        with self._lock:
+            self._dirty.pop(user_id, None)
+            conn = self._db()
+            conn.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+            conn.commit()
+
+    def import_session_files(self, directory="."):
+        """Move old ``<user_id>.session`` SQLite files into the vault (run once at startup).
+
+        Imported files are renamed to ``.session.imported`` so a later logout
+        can't be undone by importing them again.
+        """
+        imported = 0
+        for path in glob.glob(os.path.join(directory, "*.session")):
+            user_id = os.path.basename(path)[:-len(".session")]
+            try:
+                if not self.has(user_id):
+                    with sqlite3.connect(path) as conn:
+                        row = conn.execute("SELECT dc_id, server_address, port, auth_key FROM sessions").fetchone()
+                        entities = conn.execute("SELECT id, hash, username, phone, name FROM entities").fetchall()
+                    if row is None or not row[3]:
+                        continue
+                    session = StringSession()
+                    session.set_dc(row[0], row[1], row[2])
+                    session.auth_key = AuthKey(row[3])
+                    self.save_auth(user_id, session.save())
+                    self.mark_dirty(user_id, VaultSession(self, user_id, entities=entities))
+                    imported += 1
+                os.replace(path, f"{path}.imported")
+            except (sqlite3.Error, OSError, ValueError) as e:
+                logger.error(f"Could not import session file {path}: {e}")
+        if imported:
+            self.flush()
+            logger.info(f"Imported {imported} session files into {self.path}")
+        return imported
+
+
+session_vault = SessionVault()
+atexit.register(session_vault.flush)
@@ -0,0 +1,227 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+
+from telethon import TelegramClient
+
+from config_store import store
+from session_vault import session_vault
+
+# How long a successful is_user_authorized() probe is trusted, in seconds
+AUTH_CHECK_TTL = float(os.getenv("AUTH_CHECK_TTL", "300"))
+# How long Flask waits for the bot's event loop to come up / for a coroutine to finish
+LOOP_WAIT_TIMEOUT = float(os.getenv("SESSION_LOOP_TIMEOUT", "120"))
+# Seconds a client nobody is using stays connected before it is closed
+SESSION_IDLE_TIMEOUT = float(os.getenv("SESSION_IDLE_TIMEOUT", "900"))
+
+logger = logging.getLogger(__name__)
+
+
+class SessionError(Exception):
+    """Raised when a user has no usable Telegram session (no credentials or no session file)."""
+
+
+class SessionManager:
+    """One long-lived TelegramClient per user, shared by every part of the bot.
+
+    Clients are created on first use, reconnected if they dropped, and kept open
+    between forwarding ticks, autoreply and the web app. ``lease`` hands a client
+    out; ``is_authorized`` caches a positive probe for ``auth_ttl`` seconds.
+    A ``close`` while the client is leased waits for the last lease to end.
+    ``run_idle_sweeper`` closes clients that have been unused for
+    ``idle_timeout`` seconds, unless a keep-alive check (running forwarding,
+    autoreply) still wants them.
+    All clients live on the bot's event loop; other threads go through ``run_sync``.
+    Sessions come from the session vault, so no client opens a .session file.
+
+    In the bot process of worker mode, ``remote_owner(user_id)`` says whether a
+    worker process holds the user's client; such users get no client here, so
+    one auth key is never connected from two processes. ``on_client_change``
+    is told when a client is opened or closed (workers report it to the bot).
+    """
+
+    def __init__(self, auth_ttl=AUTH_CHECK_TTL, idle_timeout=SESSION_IDLE_TIMEOUT):
+        self.auth_ttl = auth_ttl
+        self.idle_timeout = idle_timeout
+        self.loop = None
+        self._ready = threading.Event()
+        self._clients = {}
+        self._credentials = {}
+        self._locks = {}
+        self._leases = {}
+        self._authorized_at = {}
+        self._last_used = {}
+        # user_id -> delete_session for closes waiting on a lease
+        self._pending_close = {}
+        self._keep_alive = []
+        self.remote_owner = None
+        self.on_client_change = None
+
+    def bind_loop(self, loop):
+        self.loop = loop
+        self._ready.set()
+
+    def has_session(self, user_id):
+        return session_vault.has(user_id)
+
+    def _lock_for(self, user_id):
+        lock = self._locks.get(user_id)
+        if lock is None:
+            lock = self._locks[user_id] = asyncio.Lock()
+        return lock
+
+    async def get_client(self, user_id, require_session=True):
+        """Return the user's connected client, creating or reconnecting it as needed."""
+        async with self._lock_for(user_id):
+            return await self._get_client(user_id, require_session)
+
+    async def _get_client(self, user_id, require_session):
+        # Caller holds the user's lock
+        user_data = store.get_user(user_id)
+        credentials = (user_data.get("api_id"), user_data.get("api_hash"))
+        if not all(credentials):
+            raise SessionError("API ID and Hash not found")
+        if require_session and not self.has_session(user_id):
+            raise SessionError("No saved session")
+        if self.remote_owner is not None and self.remote_owner(user_id):
+            raise SessionError("This account is in use by forwarding or autoreply; stop them and try again")
+
+        client = self._clients.get(user_id)
+        # New credentials take over once nobody is sending with the old client
+        if client is not None and self._credentials.get(user_id) != credentials and not self._leases.get(user_id):
+            await self._disconnect(user_id)
+            client = None
+        if client is None:
+            client = TelegramClient(session_vault.session(user_id), *credentials)
+            self._clients[user_id] = client
+            self._credentials[user_id] = credentials
+            if self.on_client_change is not None:
+                self.on_client_change(user_id, True)
+        if not client.is_connected():
+            await client.connect()
+            self._authorized_at.pop(user_id, None)
+        self._last_used[user_id] = time.monotonic()
+        return client
+
+    @asynccontextmanager
+    async def lease(self, user_id, require_session=True):
+        """Borrow the user's client; it stays connected after the block ends."""
+        client = await self.get_client(user_id, require_session)
+        self._leases[user_id] = self._leases.get(user_id, 0) + 1
+        try:
+            yield client
+        finally:
+            self._leases[user_id] -= 1
+            if not self._leases[user_id]:
+                del self._leases[user_id]
+                self._last_used[user_id] = time.monotonic()
+                if user_id in self._pending_close:
+                    async with self._lock_for(user_id):
+                        await self._close(user_id, self._pending_close.pop(user_id, False))
+
+    async def is_authorized(self, user_id, force=False):
+        """Whether the user's session is logged in, probing Telegram at most once per ``auth_ttl``.
+
+        Only callers for the same user wait on each other; the probe for one
+        user never holds up another.
+        """
+        if self.remote_owner is not None and self.remote_owner(user_id):
+            # The worker only keeps clients of logged-in users open
+            return True
+        async with self._lock_for(user_id):
+            checked = self._authorized_at.get(user_id)
+            if not force and checked is not None and time.monotonic() - checked < self.auth_ttl:
+                client = self._clients.get(user_id)
+                if client is not None and client.is_connected():
+                    return True
+            try:
+                client = await self._get_client(user_id, True)
+            except SessionError:
+                return False
+            if await client.is_user_authorized():
+                self._persist(user_id)
+                self._authorized_at[user_id] = time.monotonic()
+                return True
+            self._authorized_at.pop(user_id, None)
+            return False
+
+    def mark_authorized(self, user_id):
+        """Record a successful login; this is what puts the user's session in the vault."""
+        self._persist(user_id)
+        self._authorized_at[user_id] = time.monotonic()
+
+    def _persist(self, user_id):
+        client = self._clients.get(user_id)
+        if client is not None and not client.session.persisted:
+            client.session.persist()
+
+    async def _disconnect(self, user_id):
+        client = self._clients.pop(user_id, None)
+        self._credentials.pop(user_id, None)
+        self._authorized_at.pop(user_id, None)
+        if client is None:
+            return
+        try:
+            if client.is_connected():
+                await client.disconnect()
+        finally:
+            if self.on_client_change is not None:
+                self.on_client_change(user_id, False)
+
+    async def close(self, user_id, delete_session=False):
+        """Disconnect and forget the user's client, optionally removing the saved session.
+
+        If the client is leased (a forwarding tick mid-send) this happens when the last lease ends.
+        """
+        async with self._lock_for(user_id):
+            if self._leases.get(user_id):
+                self._pending_close[user_id] = self._pending_close.get(user_id, False) or delete_session
+                return
+            await self._close(user_id, delete_session)
+
+    async def _close(self, user_id, delete_session):
+        # Caller holds the user's lock
+        self._last_used.pop(user_id, None)
+        await self._disconnect(user_id)
+        if delete_session:
+            session_vault.delete(user_id)
+
+    def add_keep_alive(self, check):
+        """Register ``check(user_id) -> bool``; the idle sweeper leaves a client open while any says True."""
+        self._keep_alive.append(check)
+
+    async def run_idle_sweeper(self):
+        """Close clients nothing has used for ``idle_timeout`` seconds, checking every minute or so."""
+        while True:
+            await asyncio.sleep(min(60, self.idle_timeout))
+            now = time.monotonic()
+            for user_id in list(self._clients):
+                if self._leases.get(user_id) or now - self._last_used.get(user_id, now) < self.idle_timeout:
+                    continue
+                if any(check(user_id) for check in self._keep_alive):
+                    continue
+                try:
+                    await self.close(user_id)
+                    logger.info(f"Closed idle Telegram client for user {user_id}")
+                except Exception as e:
+                    logger.error(f"Error closing idle client for user {user_id}: {e}")
+
+    async def close_all(self):
+        for user_id in list(self._clients):
+            try:
+                await self.close(user_id)
+            except Exception as e:
+                logger.error(f"Error closing Telegram client for user {user_id}: {e}")
+
+    def run_sync(self, coro, timeout=LOOP_WAIT_TIMEOUT):
+        """Run ``coro`` on the bot's event loop from another thread and wait for its result."""
+        if not self._ready.wait(timeout):
+            coro.close()
+            raise RuntimeError("Bot event loop is not running")
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+
+session_manager = SessionManager()
@@ -1,5 +1,9 @@
+import atexit
 import json
-from collections import defaultdict
+import threading
+import time
+from array import array
+import serializer
 from telegram import Update
 from telegram.ext import ContextTypes
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
@@ -10,51 +14,282 @@ load_dotenv()
 ADMIN_IDS = os.getenv("ADMIN_IDS").split(',')
 
 
+TRACK_FILE = 'track.json'
+SERIES_FILE = 'track_series.json'
+# Seconds between writes of the in-memory counters to track.json
+TRACK_FLUSH_INTERVAL = float(os.getenv("TRACK_FLUSH_INTERVAL", "30"))
+# Destinations per user that get their own latency series; the rest share one
+TRACK_GROUP_SERIES_MAX = int(os.getenv("TRACK_GROUP_SERIES_MAX", "100"))
+OTHER_DESTINATIONS = "(other destinations)"
+
+
 def load_tracking_stats():
     try:
-        with open('track.json', 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return defaultdict(lambda: {
-            "total_forwards": 0,
-            "successful": 0,
-            "failed": 0,
-            "groups": defaultdict(int)
-        })
-    except json.JSONDecodeError:
-        return defaultdict(lambda: {
-            "total_forwards": 0,
-            "successful": 0,
-            "failed": 0,
-            "groups": defaultdict(int)
-        })
+        return serializer.read_file(TRACK_FILE)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
 
 def save_tracking_stats(stats):
-    with open('track.json', 'w') as f:
-        json.dump(stats, f, indent=4)
-
-async def track_forward(user_id, success, group=None):
-    stats = load_tracking_stats()
-    
-    if user_id not in stats:
-        stats[user_id] = {
-            "total_forwards": 0,
-            "successful": 0,
-            "failed": 0,
-            "groups": {}
+    serializer.write_file(TRACK_FILE, stats)
+
+
+class RollingCounter:
+    """Ring of ``slots`` time buckets, each ``width`` seconds wide.
+
+    Every slot remembers which bucket (epoch) it currently holds, so stale
+    slots are reset lazily when the ring wraps around instead of by a timer.
+    """
+
+    __slots__ = ("width", "slots", "epochs", "sent", "failed", "latency_ms", "timed")
+
+    def __init__(self, width, slots):
+        self.width = width
+        self.slots = slots
+        self.epochs = array('q', [-1]) * slots
+        self.sent = array('q', [0]) * slots
+        self.failed = array('q', [0]) * slots
+        self.latency_ms = array('q', [0]) * slots
+        self.timed = array('q', [0]) * slots
+
+    def add(self, now, success, latency=None):
+        epoch = int(now // self.width)
+        i = epoch % self.slots
+        if self.epochs[i] != epoch:
+            self.epochs[i] = epoch
+            self.sent[i] = self.failed[i] = self.latency_ms[i] = self.timed[i] = 0
+        if success:
+            self.sent[i] += 1
+        else:
+            self.failed[i] += 1
+        if latency is not None:
+            self.latency_ms[i] += int(latency * 1000)
+            self.timed[i] += 1
+
+    def totals(self, now, span=None):
+        """Sum (sent, failed, latency_ms, timed) over the last ``span`` buckets."""
+        current = int(now // self.width)
+        oldest = current - min(span or self.slots, self.slots)
+        sent = failed = latency_ms = timed = 0
+        for i, epoch in enumerate(self.epochs):
+            if oldest < epoch <= current:
+                sent += self.sent[i]
+                failed += self.failed[i]
+                latency_ms += self.latency_ms[i]
+                timed += self.timed[i]
+        return sent, failed, latency_ms, timed
+
+    def to_dict(self):
+        return {
+            "width": self.width,
+            "epochs": self.epochs.tolist(),
+            "sent": self.sent.tolist(),
+            "failed": self.failed.tolist(),
+            "latency_ms": self.latency_ms.tolist(),
+            "timed": self.timed.tolist(),
         }
-    
-    stats[user_id]["total_forwards"] += 1
-    stats[user_id]["successful" if success else "failed"] += 1
-    
-    if group:
-        if "groups" not in stats[user_id]:
-            stats[user_id]["groups"] = {}
-        if group not in stats[user_id]["groups"]:
-            stats[user_id]["groups"][group] = 0
-        stats[user_id]["groups"][group] += 1
-    
-    save_tracking_stats(stats)
+
+    @classmethod
+    def from_dict(cls, data, width, slots):
+        counter = cls(width, slots)
+        if data.get("width") == width and len(data.get("epochs", [])) == slots:
+            for name in ("epochs", "sent", "failed", "latency_ms", "timed"):
+                setattr(counter, name, array('q', data[name]))
+        return counter
+
+
+class UserSeries:
+    """Minute, hour and day rollups of one user's forwarding outcomes."""
+
+    __slots__ = ("minute", "hour", "day")
+
+    LAYOUT = (("minute", 60, 60), ("hour", 3600, 48), ("day", 86400, 30))
+
+    def __init__(self, data=None):
+        data = data or {}
+        for name, width, slots in self.LAYOUT:
+            setattr(self, name, RollingCounter.from_dict(data.get(name, {}), width, slots))
+
+    def add(self, now, success, latency=None):
+        for name, _, _ in self.LAYOUT:
+            getattr(self, name).add(now, success, latency)
+
+    def to_dict(self):
+        return {name: getattr(self, name).to_dict() for name, _, _ in self.LAYOUT}
+
+
+# Destinations only get an hourly ring (enough for the 24h view in /stats),
+# since a scraped-members run can touch thousands of them
+GROUP_BUCKET_WIDTH = 3600
+GROUP_BUCKET_SLOTS = 24
+
+
+class ForwardTracker:
+    """Forwarding counters kept in memory and written to track.json in the background.
+
+    ``record`` only bumps counters; a timer writes the file at most once every
+    ``flush_interval`` seconds, and again at shutdown.
+    """
+
+    def __init__(self, flush_interval=TRACK_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        # Serializes file writes, which happen outside self._lock
+        self._write_lock = threading.Lock()
+        self._timer = None
+        self._dirty = False
+        self.stats = load_tracking_stats()
+        self.series = {}
+        self.group_series = {}
+        self._load_series()
+
+    def _load_series(self):
+        try:
+            data = serializer.read_file(SERIES_FILE)
+        except (FileNotFoundError, json.JSONDecodeError):
+            data = {}
+        for user_id, entry in data.items():
+            self.series[user_id] = UserSeries(entry.get("user"))
+            groups = list(entry.get("groups", {}).items())[:TRACK_GROUP_SERIES_MAX + 1]
+            self.group_series[user_id] = {
+                group: RollingCounter.from_dict(counter, GROUP_BUCKET_WIDTH, GROUP_BUCKET_SLOTS)
+                for group, counter in groups
+            }
+
+    def _series_snapshot(self):
+        # Caller holds self._lock; to_dict copies the counters
+        return {
+            user_id: {
+                "user": series.to_dict(),
+                "groups": {group: counter.to_dict() for group, counter in self.group_series.get(user_id, {}).items()},
+            }
+            for user_id, series in self.series.items()
+        }
+
+    def get_user(self, user_id):
+        with self._lock:
+            user_stats = self.stats.get(user_id)
+            if user_stats is None:
+                return {"total_forwards": 0, "successful": 0, "failed": 0, "groups": {}}
+            return {**user_stats, "groups": dict(user_stats.get("groups", {}))}
+
+    def get_recent(self, user_id, slowest=5):
+        """Throughput, 24h failure rate and the slowest destinations for /stats."""
+        now = time.time()
+        with self._lock:
+            series = self.series.get(user_id)
+            if series is None:
+                return None
+            last_hour = series.minute.totals(now)
+            last_day = series.hour.totals(now, 24)
+            last_week = series.day.totals(now, 7)
+            latencies = []
+            for group, counter in self.group_series.get(user_id, {}).items():
+                _, _, latency_ms, timed = counter.totals(now)
+                if timed:
+                    latencies.append((latency_ms / timed / 1000, group))
+        latencies.sort(reverse=True)
+        day_total = last_day[0] + last_day[1]
+        return {
+            "last_hour": last_hour[0],
+            "per_hour": last_day[0] / 24,
+            "failure_rate": last_day[1] / day_total if day_total else 0.0,
+            "last_week": last_week[0],
+            "slowest": latencies[:slowest],
+        }
+
+    def record(self, user_id, success, group=None, latency=None):
+        now = time.time()
+        with self._lock:
+            series = self.series.get(user_id)
+            if series is None:
+                series = self.series[user_id] = UserSeries()
+            series.add(now, success, latency)
+            if group:
+                groups = self.group_series.setdefault(user_id, {})
+                counter = groups.get(group)
+                if counter is None:
+                    # Scraped-member runs send to thousands of users; past the cap they share a series
+                    if len(groups) >= TRACK_GROUP_SERIES_MAX:
+                        group = OTHER_DESTINATIONS
+                    counter = groups.get(group)
+                    if counter is None:
+                        counter = groups[group] = RollingCounter(GROUP_BUCKET_WIDTH, GROUP_BUCKET_SLOTS)
+                counter.add(now, success, latency)
+
+            user_stats = self.stats.get(user_id)
+            if user_stats is None:
+                user_stats = self.stats[user_id] = {
+                    "total_forwards": 0,
+                    "successful": 0,
+                    "failed": 0,
+                    "groups": {}
+                }
+            user_stats["total_forwards"] += 1
+            user_stats["successful" if success else "failed"] += 1
+            if group:
+                groups = user_stats.setdefault("groups", {})
+                groups[group] = groups.get(group, 0) + 1
+            self._dirty = True
+            if self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Copy the counters under the lock, then write the files without holding it."""
+        with self._write_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                if not self._dirty:
+                    return
+                stats = {
+                    user_id: {**user_stats, "groups": dict(user_stats.get("groups", {}))}
+                    for user_id, user_stats in self.stats.items()
+                }
+                series = self._series_snapshot()
+                self._dirty = False
+            save_tracking_stats(stats)
+            serializer.write_file(SERIES_FILE, series)
+
+    def drop_user(self, user_id):
+        """Forget a removed user's rolling series (their track.json totals are kept)."""
+        with self._lock:
+            if self.series.pop(user_id, None) is not None or self.group_series.pop(user_id, None) is not None:
+                self._dirty = True
+
+    def replace(self, path):
+        """Make the counters in ``path`` (a /settrack upload) current and write them to track.json.
+
+        Holds the write lock throughout, so a flush that copied the old
+        counters can't write them over the upload afterwards.
+        """
+        with self._write_lock:
+            stats = serializer.read_file(path)
+            with self._lock:
+                self.stats = stats
+                self._dirty = False
+            save_tracking_stats(stats)
+
+
+tracker = ForwardTracker()
+atexit.register(tracker.flush)
+
+# Set in worker processes so results are counted by the bot process, which owns track.json
+forward_sink = None
+# Extra /stats sections from other parts of the bot: fn(user_id, is_admin) -> Markdown text or None
+stats_sections = []
+
+def register_stats_section(section):
+    stats_sections.append(section)
+    return section
+
+async def track_forward(user_id, success, group=None, latency=None):
+    if forward_sink is not None:
+        forward_sink(user_id, success, group, latency)
+        return
+    tracker.record(user_id, success, group, latency)
 
 async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     # Handle both direct commands and callback queries
@@ -67,13 +302,7 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         message = update.message
     from main import is_authorized
     if await is_authorized(user_id):
-        stats = load_tracking_stats()
-        user_stats = stats.get(user_id, {
-            "total_forwards": 0,
-            "successful": 0,
-            "failed": 0,
-            "groups": {}
-        })
+        user_stats = tracker.get_user(user_id)
         
         stats_text = (
             "📊 *Forwarding Statistics*\n\n"
@@ -85,7 +314,26 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         
         for group, count in user_stats.get("groups", {}).items():
             stats_text += f"`{group}`: {count} messages\n"
+
+        recent = tracker.get_recent(user_id)
+        if recent:
+            stats_text += (
+                "\n*Recent Activity:*\n"
+                f"Last hour: `{recent['last_hour']}` sent\n"
+                f"Sends/hour (24h avg): `{recent['per_hour']:.1f}`\n"
+                f"Failure rate (24h): `{recent['failure_rate']:.1%}`\n"
+                f"Last 7 days: `{recent['last_week']}` sent\n"
+            )
+            if recent["slowest"]:
+                stats_text += "\n*Slowest Destinations (24h):*\n"
+                for seconds, group in recent["slowest"]:
+                    stats_text += f"`{group}`: {seconds:.2f}s\n"
             
+        for section in stats_sections:
+            text = section(user_id, user_id in ADMIN_IDS)
+            if text:
+                stats_text += text
+
         keyboard = [[InlineKeyboardButton("🔄 Refresh Stats", callback_data='refresh_stats')]]
         reply_markup = InlineKeyboardMarkup(keyboard)
 
@@ -98,7 +346,8 @@ async def get_track(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = str(update.message.from_user.id)
     if user_id in ADMIN_IDS:
         try:
-            with open('track.json', 'r', encoding='utf-8') as file:
+            tracker.flush()
+            with open(TRACK_FILE, 'r', encoding='utf-8') as file:
                 await update.message.reply_document(
                     document=file,
                     filename='track.json',
@@ -117,7 +366,12 @@ async def set_track(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             if doc.file_name == 'track.json':
                 file = await context.bot.get_file(doc.file_id)
                 try:
-                    await file.download_to_drive('track.json')
+                    upload = f"{TRACK_FILE}.upload"
+                    await file.download_to_drive(upload)
+                    try:
+                        tracker.replace(upload)
+                    finally:
+                        os.remove(upload)
                     await update.message.reply_text("✅ Tracking stats file updated successfully!")
                 except Exception as e:
                     await update.message.reply_text(f"❌ Error updating track file: {str(e)}")
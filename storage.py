@@ -0,0 +1,332 @@
+import copy
+import json
+import logging
+import os
+import sqlite3
+import time
+
+import serializer
+
+logger = logging.getLogger(__name__)
+
+
+def read_json_config(path):
+    """Read a config.json style file, always returning a dict with a "users" key."""
+    try:
+        data = serializer.read_file(path)
+    except FileNotFoundError:
+        data = {}
+    except json.JSONDecodeError as e:
+        logger.error(f"Could not parse {path}: {e}")
+        data = {}
+    if "users" not in data:
+        data["users"] = {}
+    return data
+
+
+class JsonBackend:
+    """Keeps the whole config in a single JSON file, rewritten on every flush."""
+
+    def __init__(self, path="config.json"):
+        self.path = path
+
+    def load(self):
+        return read_json_config(self.path)
+
+    def snapshot(self, data, dirty):
+        # Called with the store lock held; the returned payload is written outside it
+        return serializer.dumps(data)
+
+    def write(self, payload):
+        serializer.write_bytes(self.path, payload)
+
+    def export(self, data):
+        """Rewrite config.json pretty-printed for /getjson."""
+        serializer.write_file(self.path, data, pretty=True)
+        return self.path
+
+
+class JournalBackend:
+    """config.json snapshot plus an append-only journal of per-user changes.
+
+    A flush appends one line per dirty user (the full record, or a delete) and
+    fsyncs once for the batch, so its cost no longer depends on how many users
+    there are. On load the journal is replayed over the snapshot; a torn last
+    line from a crash is dropped. Once the journal grows past ``max_bytes`` or
+    ``compact_interval`` seconds have passed, the next flush writes a fresh
+    snapshot and empties the journal instead.
+
+    Journal lines carry the generation they were written in and the snapshot
+    records the last generation it includes, so a crash between writing the
+    snapshot and emptying the journal can't replay stale lines over it.
+    Top-level keys other than ``users`` are only written by a compaction.
+    """
+
+    def __init__(self, path="config.json", journal_path=None, max_bytes=1024 * 1024, compact_interval=300):
+        self.path = path
+        self.journal_path = journal_path or f"{os.path.splitext(path)[0]}.journal"
+        self.max_bytes = max_bytes
+        self.compact_interval = compact_interval
+        self._last_compact = time.monotonic()
+        # Generation of the lines being appended; the snapshot holds everything before it
+        self._generation = 1
+
+    def load(self):
+        data = read_json_config(self.path)
+        covered = data.pop("journal_generation", 0)
+        self._generation = covered + 1
+        users = data["users"]
+        replayed = 0
+        good_offset = 0
+        try:
+            with open(self.journal_path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        entry = serializer.loads(line)
+                    except ValueError:
+                        break
+                    # Lines from before the journal_generation key existed count as generation 1
+                    if entry.get("gen", 1) > covered:
+                        if entry["op"] == "put":
+                            users[entry["id"]] = entry["record"]
+                        elif entry["op"] == "del":
+                            users.pop(entry["id"], None)
+                    good_offset += len(line)
+                    replayed += 1
+        except FileNotFoundError:
+            return data
+
+        if good_offset != os.path.getsize(self.journal_path):
+            logger.warning(f"Dropping torn tail of {self.journal_path} after {replayed} entries")
+            with open(self.journal_path, "r+b") as f:
+                f.truncate(good_offset)
+        if replayed:
+            logger.info(f"Replayed {replayed} journal entries from {self.journal_path}")
+        return data
+
+    def _journal_size(self):
+        try:
+            return os.path.getsize(self.journal_path)
+        except FileNotFoundError:
+            return 0
+
+    def _compact_due(self):
+        return (
+            self._journal_size() >= self.max_bytes
+            or time.monotonic() - self._last_compact >= self.compact_interval
+        )
+
+    def _snapshot_body(self, data, pretty=False):
+        return serializer.dumps({**data, "journal_generation": self._generation}, pretty=pretty)
+
+    def snapshot(self, data, dirty):
+        if self._compact_due():
+            return "compact", self._snapshot_body(data)
+        lines = []
+        for user_id in dirty:
+            record = data["users"].get(user_id)
+            if record is None:
+                lines.append(serializer.dumps({"op": "del", "id": user_id, "gen": self._generation}))
+            else:
+                lines.append(serializer.dumps({"op": "put", "id": user_id, "record": record, "gen": self._generation}))
+        return "append", b"".join(line + b"\n" for line in lines)
+
+    def write(self, payload):
+        kind, body = payload
+        if kind == "compact":
+            self._compact(body)
+            return
+        with open(self.journal_path, "ab") as f:
+            f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _compact(self, body):
+        # The snapshot has to be durable before the journal it replaces goes away;
+        # until then, its journal_generation makes load skip the lines it already holds
+        serializer.write_bytes(self.path, body, fsync=True)
+        self._generation += 1
+        with open(self.journal_path, "wb"):
+            pass
+        self._last_compact = time.monotonic()
+
+    def export(self, data):
+        """Compact so config.json is current (pretty-printed), then hand it to /getjson."""
+        self._compact(self._snapshot_body(data, pretty=True))
+        return self.path
+
+
+class SqliteBackend:
+    """One row per user plus child tables, so a flush only rewrites the users that changed.
+
+    Scalar settings live as a JSON blob in ``users.data``; the list/map fields that
+    grow with use (groups, post_messages, keywords, scraped_groups) get their own
+    tables keyed by user_id. On first start the existing config.json is imported.
+    """
+
+    CHILD_KEYS = ("groups", "post_messages", "keywords", "scraped_groups")
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS users (
+            user_id TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            children TEXT NOT NULL DEFAULT ''
+        );
+        CREATE TABLE IF NOT EXISTS groups (
+            user_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            link TEXT NOT NULL,
+            PRIMARY KEY (user_id, position)
+        );
+        CREATE TABLE IF NOT EXISTS post_messages (
+            user_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            message TEXT NOT NULL,
+            PRIMARY KEY (user_id, position)
+        );
+        CREATE TABLE IF NOT EXISTS keywords (
+            user_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            keyword TEXT NOT NULL,
+            response TEXT NOT NULL,
+            PRIMARY KEY (user_id, position)
+        );
+        CREATE TABLE IF NOT EXISTS scraped_groups (
+            user_id TEXT NOT NULL,
+            group_id TEXT NOT NULL,
+            title TEXT,
+            data TEXT NOT NULL DEFAULT '{}',
+            PRIMARY KEY (user_id, group_id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_groups_link ON groups (link);
+    """
+
+    def __init__(self, path="config.db", json_path="config.json"):
+        self.path = path
+        self.json_path = json_path
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+
+    def load(self):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'imported_json'").fetchone()
+        if row is None:
+            self._import_json()
+
+        users = {}
+        for user_id, data, children in self.conn.execute("SELECT user_id, data, children FROM users"):
+            record = serializer.loads(data)
+            for key in filter(None, children.split(",")):
+                record[key] = {} if key in ("keywords", "scraped_groups") else []
+            users[user_id] = record
+
+        for user_id, link in self.conn.execute("SELECT user_id, link FROM groups ORDER BY user_id, position"):
+            users[user_id]["groups"].append(link)
+        for user_id, message in self.conn.execute("SELECT user_id, message FROM post_messages ORDER BY user_id, position"):
+            users[user_id]["post_messages"].append(message)
+        for user_id, keyword, response in self.conn.execute("SELECT user_id, keyword, response FROM keywords ORDER BY user_id, position"):
+            users[user_id]["keywords"][keyword] = response
+        for user_id, group_id, data in self.conn.execute("SELECT user_id, group_id, data FROM scraped_groups"):
+            users[user_id]["scraped_groups"][group_id] = serializer.loads(data)
+
+        data = {"users": users}
+        for key, value in self.conn.execute("SELECT key, value FROM meta WHERE key LIKE 'config:%'"):
+            data[key[len("config:"):]] = serializer.loads(value)
+        return data
+
+    def _import_json(self):
+        data = read_json_config(self.json_path)
+        if data["users"]:
+            logger.info(f"Importing {len(data['users'])} users from {self.json_path} into {self.path}")
+        self.write(self.snapshot(data, set(data["users"])))
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('imported_json', '1')")
+
+    def snapshot(self, data, dirty):
+        extra = {key: copy.deepcopy(value) for key, value in data.items() if key != "users"}
+        users = {user_id: copy.deepcopy(data["users"].get(user_id)) for user_id in dirty}
+        return extra, users
+
+    def write(self, payload):
+        extra, users = payload
+        cur = self.conn.cursor()
+        cur.execute("BEGIN")
+        try:
+            for key, value in extra.items():
+                cur.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (f"config:{key}", serializer.dumps_str(value)))
+            for user_id, record in users.items():
+                for table in ("users",) + self.CHILD_KEYS:
+                    cur.execute(f"DELETE FROM {table} WHERE user_id = ?", (user_id,))
+                if record is not None:
+                    self._insert_user(cur, user_id, record)
+            cur.execute("COMMIT")
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+
+    def _insert_user(self, cur, user_id, record):
+        scalars = {key: value for key, value in record.items() if key not in self.CHILD_KEYS}
+        children = [key for key in self.CHILD_KEYS if key in record]
+        cur.execute(
+            "INSERT INTO users (user_id, data, children) VALUES (?, ?, ?)",
+            (user_id, serializer.dumps_str(scalars), ",".join(children)),
+        )
+        cur.executemany(
+            "INSERT INTO groups (user_id, position, link) VALUES (?, ?, ?)",
+            [(user_id, i, link) for i, link in enumerate(record.get("groups") or [])],
+        )
+        cur.executemany(
+            "INSERT INTO post_messages (user_id, position, message) VALUES (?, ?, ?)",
+            [(user_id, i, message) for i, message in enumerate(record.get("post_messages") or [])],
+        )
+        cur.executemany(
+            "INSERT INTO keywords (user_id, position, keyword, response) VALUES (?, ?, ?, ?)",
+            [(user_id, i, keyword, response) for i, (keyword, response) in enumerate((record.get("keywords") or {}).items())],
+        )
+        cur.executemany(
+            "INSERT INTO scraped_groups (user_id, group_id, title, data) VALUES (?, ?, ?, ?)",
+            [
+                (user_id, group_id, group.get("title"), serializer.dumps_str(group))
+                for group_id, group in (record.get("scraped_groups") or {}).items()
+            ],
+        )
+
+    def export(self, data):
+        """Write the current config to config.json so /getjson can send it."""
+        serializer.write_file(self.json_path, data, pretty=True)
+        return self.json_path
+
+
+class ReplicaBackend:
+    """Nothing on disk: a worker process's copy of its users, filled and kept in sync by the bot process.
+
+    The bot process owns persistence, so flushes are dropped here.
+    """
+
+    def load(self):
+        return {"users": {}}
+
+    def snapshot(self, data, dirty):
+        return None
+
+    def write(self, payload):
+        pass
+
+    def export(self, data):
+        raise RuntimeError("The config can only be exported from the bot process")
+
+
+def make_backend(kind, json_path="config.json", sqlite_path="config.db", **journal_options):
+    if kind == "sqlite":
+        return SqliteBackend(sqlite_path, json_path)
+    if kind == "json":
+        return JsonBackend(json_path)
+    if kind == "replica":
+        return ReplicaBackend()
+    return JournalBackend(json_path, **journal_options)
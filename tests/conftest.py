@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Modules read these at import time and keep their files in the working
+# directory; keep the tests off the real config, caches and bot
+os.environ.setdefault("ADMIN_IDS", "1")
+os.environ.setdefault("BOT_TOKEN", "0:test")
+os.chdir(tempfile.mkdtemp(prefix="autoforwarder-tests-"))
@@ -0,0 +1,31 @@
+import pytest
+
+pytest.importorskip("telethon")
+
+from antidelete import CachedMessage, MessageCache
+
+
+def wheel_size(cache):
+    return sum(len(slot) for slot in cache._wheel)
+
+
+def test_wheel_stays_bounded_after_eviction():
+    cache = MessageCache(max_bytes=10000, chat_max=1000, ttl=86400, tick=60)
+    for msg_id in range(100000):
+        cache.put("u", msg_id % 50, msg_id, CachedMessage(1, "Ann", "hello", 0))
+
+    assert cache.bytes <= cache.max_bytes
+    assert wheel_size(cache) == len(cache)
+
+    cache.drop_user("u")
+    assert len(cache) == 0
+    assert wheel_size(cache) == 0
+
+
+def test_pop_removes_from_wheel():
+    cache = MessageCache(ttl=600, tick=60)
+    cache.put("u", 1, 7, CachedMessage(1, "Ann", "hello", 0))
+
+    assert cache.pop("u", 1, 7).text == "hello"
+    assert cache.pop_message("u", 7) is None
+    assert wheel_size(cache) == 0
@@ -0,0 +1,15 @@
+from config_store import ConfigStore
+from storage import JsonBackend
+
+
+def test_writes_after_delete_do_not_recreate_user(tmp_path):
+    store = ConfigStore(backend=JsonBackend(str(tmp_path / "config.json")))
+    store.set_user("10", {"post_index": 0, "forwarding_on": True})
+    store.delete_user("10")
+
+    store.update_user("10", post_index=3)
+    store.submit("10", lambda record: record.update(api_id="1"))
+
+    assert not store.has_user("10")
+    assert store.update_user("11", create=True, forwarding_on=False) == {"forwarding_on": False}
+    assert store.get_user("11") == {"forwarding_on": False}
@@ -0,0 +1,36 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("telegram")
+pytest.importorskip("telethon")
+pytest.importorskip("flask")
+
+import main
+from config_store import ConfigStore
+from storage import JsonBackend
+
+
+def test_rehydrate_users_restores_active_users(monkeypatch, tmp_path):
+    store = ConfigStore(backend=JsonBackend(str(tmp_path / "config.json")))
+    store.set_user("10", {"forwarding_on": True, "auto_reply_status": False})
+    store.set_user("11", {"forwarding_on": False, "auto_reply_status": True})
+    store.set_user("12", {"forwarding_on": False, "auto_reply_status": False})
+    store.set_user("13", {"forwarding_on": True})
+    restored = []
+
+    async def is_authorized(user_id):
+        return user_id != "13"
+
+    async def rehydrate_user(context, user_id, semaphore):
+        restored.append(user_id)
+        return "restored"
+
+    monkeypatch.setattr(main, "store", store)
+    monkeypatch.setattr(main, "REHYDRATE_WINDOW", 0)
+    monkeypatch.setattr(main, "is_authorized", is_authorized)
+    monkeypatch.setattr(main, "rehydrate_user", rehydrate_user)
+
+    asyncio.run(main.rehydrate_users(None))
+
+    assert sorted(restored) == ["10", "11"]
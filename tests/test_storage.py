@@ -0,0 +1,25 @@
+from storage import JournalBackend
+
+
+def test_stale_journal_is_not_replayed_over_newer_snapshot(tmp_path):
+    path = str(tmp_path / "config.json")
+    backend = JournalBackend(path, max_bytes=1 << 20, compact_interval=3600)
+    data = backend.load()
+    data["users"]["10"] = {"interval": "60"}
+    backend.write(backend.snapshot(data, {"10"}))
+    journal = open(backend.journal_path, "rb").read()
+
+    del data["users"]["10"]
+    data["users"]["11"] = {"interval": "30"}
+    backend._compact(backend._snapshot_body(data))
+    # Crash before the journal was emptied: the old lines are still there
+    with open(backend.journal_path, "wb") as f:
+        f.write(journal)
+
+    reloaded = JournalBackend(path)
+    assert reloaded.load()["users"] == {"11": {"interval": "30"}}
+
+    data = reloaded.load()
+    data["users"]["12"] = {}
+    reloaded.write(reloaded.snapshot(data, {"12"}))
+    assert set(JournalBackend(path).load()["users"]) == {"11", "12"}
@@ -0,0 +1,335 @@
+"""Optional multi-process mode: forwarding and autoreply run in worker processes.
+
+With ``WORKER_PROCESSES`` set above 0 the bot process keeps the Telegram bot,
+the Flask app and the config, and starts that many workers. Each worker owns
+the Telethon clients of the users whose id hashes to it, runs their
+forwarding ticks and autoreply handlers on its own event loop, and gets a
+replica of just those users' config. The two sides talk over a pipe:
+
+bot -> worker: ("snapshot", {user_id: bytes}), ("user", user_id, bytes | None),
+    ("forward_start" | "forward_stop" | "autoreply_start" | "autoreply_stop" | "close", user_id), ("stop",)
+worker -> bot: ("update", user_id, bytes), ("track", user_id, success, group, latency),
+    ("client", user_id, open)
+
+Config changes made in a worker (post_index, forwarding_on=False, ...) are sent
+back as per-field diffs and applied by the bot process, which alone writes
+config.json. A worker that dies is started again, after an exponentially
+growing delay, and rehydrates its users; one that keeps dying is given up on.
+
+While a worker has a user's client open, the bot process refuses to open one
+for that user (login, scraping, the web app), so an auth key is never used
+from two processes at once; ``release`` asks the worker to let go first.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import zlib
+from types import SimpleNamespace
+
+import serializer
+
+# Number of worker processes; 0 keeps everything in the bot process
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "0"))
+# Seconds release() waits for a worker to close a user's client
+WORKER_RELEASE_TIMEOUT = float(os.getenv("WORKER_RELEASE_TIMEOUT", "10"))
+# A worker that dies more than this many times within WORKER_RESTART_WINDOW seconds is not restarted again
+WORKER_MAX_RESTARTS = int(os.getenv("WORKER_MAX_RESTARTS", "5"))
+WORKER_RESTART_WINDOW = float(os.getenv("WORKER_RESTART_WINDOW", "600"))
+
+logger = logging.getLogger(__name__)
+
+_env_lock = threading.Lock()
+_MISSING = object()
+
+
+def shard_of(user_id, processes):
+    return zlib.crc32(str(user_id).encode()) % processes
+
+
+class WorkerHandle:
+    """The bot process's end of one worker: the process, its pipe and a sender thread."""
+
+    def __init__(self, shard, process, conn):
+        self.shard = shard
+        self.process = process
+        self.conn = conn
+        self.outbox = queue.Queue()
+
+
+class WorkerSupervisor:
+    """Starts the workers, routes commands and config changes to them, and restarts any that die."""
+
+    def __init__(self, processes=WORKER_PROCESSES):
+        self.processes = max(0, processes)
+        self._workers = {}
+        # Users whose client is open in a worker, as reported by the workers
+        self._held = set()
+        # shard -> monotonic times of its recent restarts
+        self._restarts = {}
+        self._stopping = False
+        self._ctx = multiprocessing.get_context("spawn")
+
+    @property
+    def enabled(self):
+        return self.processes > 0
+
+    def shard_of(self, user_id):
+        return shard_of(user_id, self.processes)
+
+    def holds(self, user_id):
+        return user_id in self._held
+
+    def start(self):
+        from config_store import store
+        from sessions import session_manager
+
+        store.add_listener(self._on_change)
+        session_manager.remote_owner = self.holds
+        for shard in range(self.processes):
+            self._spawn(shard)
+        logger.info(f"Started {self.processes} forwarding worker processes")
+
+    def _spawn(self, shard):
+        from config_store import store
+
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(target=worker_main, args=(shard, child_conn), name=f"worker-{shard}", daemon=True)
+        overrides = {
+            "STORAGE_BACKEND": "replica",
+            "WORKER_PROCESSES": "0",
+            "PEER_CACHE_FILE": f"peer_cache.{shard}.json",
+        }
+        # The child reads these at import time, so they have to be in the environment it is spawned with
+        with _env_lock:
+            saved = {key: os.environ.get(key) for key in overrides}
+            os.environ.update(overrides)
+            try:
+                process.start()
+            finally:
+                for key, value in saved.items():
+                    if value is None:
+                        os.environ.pop(key, None)
+                    else:
+                        os.environ[key] = value
+        child_conn.close()
+
+        handle = WorkerHandle(shard, process, parent_conn)
+        self._workers[shard] = handle
+        with store._lock:
+            users = {
+                user_id: serializer.dumps(data)
+                for user_id, data in store.users.items() if self.shard_of(user_id) == shard
+            }
+            handle.outbox.put(("snapshot", users))
+        threading.Thread(target=self._send_loop, args=(handle,), daemon=True).start()
+        threading.Thread(target=self._recv_loop, args=(handle,), daemon=True).start()
+
+    def _on_change(self, user_id, record):
+        # Store listener: runs under the store lock, so only serialize and queue here
+        handle = self._workers.get(self.shard_of(user_id))
+        if handle is not None:
+            handle.outbox.put(("user", user_id, None if record is None else serializer.dumps(record)))
+
+    def send(self, user_id, command):
+        handle = self._workers.get(self.shard_of(user_id))
+        if handle is not None:
+            handle.outbox.put((command, user_id))
+
+    async def release(self, user_id, timeout=WORKER_RELEASE_TIMEOUT):
+        """Have the owning worker close the user's client and wait until it reports it closed."""
+        self.send(user_id, "close")
+        deadline = time.monotonic() + timeout
+        while self.holds(user_id):
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(0.1)
+        return True
+
+    def _send_loop(self, handle):
+        while True:
+            message = handle.outbox.get()
+            if message is None:
+                return
+            try:
+                handle.conn.send(message)
+            except (OSError, EOFError):
+                return
+
+    def _recv_loop(self, handle):
+        from sessions import session_manager
+        from stats import tracker
+
+        while True:
+            try:
+                message = handle.conn.recv()
+            except (OSError, EOFError):
+                break
+            kind = message[0]
+            if kind == "update":
+                _, user_id, payload = message
+                session_manager.loop.call_soon_threadsafe(_apply_update, user_id, serializer.loads(payload))
+            elif kind == "track":
+                tracker.record(*message[1:])
+            elif kind == "client":
+                _, user_id, held = message
+                if held:
+                    self._held.add(user_id)
+                else:
+                    self._held.discard(user_id)
+        handle.outbox.put(None)
+        # A dead worker's connections are gone with it
+        self._held -= {user_id for user_id in self._held if self.shard_of(user_id) == handle.shard}
+        if not self._stopping and self._workers.get(handle.shard) is handle:
+            self._restart(handle)
+
+    def _restart(self, handle):
+        # Runs on the dead worker's receive thread, so waiting here holds up nothing else
+        now = time.monotonic()
+        recent = [t for t in self._restarts.get(handle.shard, []) if now - t < WORKER_RESTART_WINDOW]
+        if len(recent) >= WORKER_MAX_RESTARTS:
+            logger.error(
+                f"Worker {handle.shard} exited (code {handle.process.exitcode}) {len(recent) + 1} times "
+                f"within {WORKER_RESTART_WINDOW:.0f}s; giving up on it, its users are not forwarding"
+            )
+            return
+        delay = min(2 ** len(recent), 60)
+        logger.error(f"Worker {handle.shard} exited (code {handle.process.exitcode}), restarting it in {delay}s")
+        time.sleep(delay)
+        if self._stopping:
+            return
+        self._restarts[handle.shard] = recent + [time.monotonic()]
+        self._spawn(handle.shard)
+
+    def stop(self):
+        self._stopping = True
+        for handle in self._workers.values():
+            handle.outbox.put(("stop",))
+        for handle in self._workers.values():
+            handle.process.join(10)
+            if handle.process.is_alive():
+                handle.process.terminate()
+
+
+def _apply_update(user_id, diff):
+    from config_store import store
+
+    # The user may have been removed while the diff was in flight; don't bring them back
+    if not store.has_user(user_id):
+        return
+    with store.edit(user_id) as record:
+        record.update(diff["set"])
+        for key in diff["unset"]:
+            record.pop(key, None)
+
+
+class ReplicaSync:
+    """Worker side of config sync: applies pushes from the bot process and sends local edits back."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self._known = {}
+        self._lock = threading.Lock()
+
+    def send(self, message):
+        with self._lock:
+            self.conn.send(message)
+
+    def apply(self, store, user_id, payload):
+        if payload is None:
+            self._known.pop(user_id, None)
+            store.delete_user(user_id)
+            return
+        self._known[user_id] = serializer.loads(payload)
+        store.set_user(user_id, serializer.loads(payload))
+
+    def on_change(self, user_id, record):
+        # Store listener: anything that differs from what the bot process last sent us is a local edit
+        if record is None:
+            self._known.pop(user_id, None)
+            return
+        known = self._known.get(user_id, {})
+        changed = {key: value for key, value in record.items() if known.get(key, _MISSING) != value}
+        removed = [key for key in known if key not in record]
+        if not changed and not removed:
+            return
+        self._known[user_id] = serializer.loads(serializer.dumps(record))
+        self.send(("update", user_id, serializer.dumps({"set": changed, "unset": removed})))
+
+
+def worker_main(shard, conn):
+    asyncio.run(_worker_loop(shard, conn))
+
+
+def _recv(conn):
+    try:
+        return conn.recv()
+    except (OSError, EOFError):
+        return None
+
+
+async def _worker_loop(shard, conn):
+    from telegram import Bot
+
+    import main as bot
+    import stats
+    from autoreply import stop_telethon_client
+    from config_store import store
+    from forward_scheduler import forward_scheduler
+    from sessions import session_manager
+
+    loop = asyncio.get_running_loop()
+    session_manager.bind_loop(loop)
+    writer = loop.create_task(store.run_writer())
+    sweeper = loop.create_task(session_manager.run_idle_sweeper())
+    sync = ReplicaSync(conn)
+    store.add_listener(sync.on_change)
+    stats.forward_sink = lambda *args: sync.send(("track",) + args)
+    session_manager.on_client_change = lambda user_id, held: sync.send(("client", user_id, held))
+
+    telegram_bot = Bot(bot.BOT_TOKEN)
+    await telegram_bot.initialize()
+    # Autoreply only needs .bot from the handler context to message the user
+    context = SimpleNamespace(bot=telegram_bot)
+    logger.info(f"Worker {shard} started")
+
+    try:
+        while True:
+            message = await loop.run_in_executor(None, _recv, conn)
+            if message is None or message[0] == "stop":
+                break
+            kind = message[0]
+            try:
+                if kind == "snapshot":
+                    for user_id, payload in message[1].items():
+                        sync.apply(store, user_id, payload)
+                    loop.create_task(bot.rehydrate_users(context))
+                elif kind == "user":
+                    sync.apply(store, message[1], message[2])
+                elif kind == "forward_start":
+                    await bot.start_forwarding(message[1])
+                elif kind == "forward_stop":
+                    await bot.stop_forwarding(message[1])
+                elif kind == "autoreply_start":
+                    await bot.start_autoreply(message[1], context)
+                elif kind == "autoreply_stop":
+                    await bot.stop_autoreply(message[1])
+                elif kind == "close":
+                    forward_scheduler.stop(message[1])
+                    await stop_telethon_client(message[1])
+                    await session_manager.close(message[1])
+            except Exception as e:
+                logger.error(f"Worker {shard} failed to handle {kind}: {e}")
+    finally:
+        forward_scheduler.stop_all()
+        await session_manager.close_all()
+        writer.cancel()
+        sweeper.cancel()
+        await telegram_bot.shutdown()
+        logger.info(f"Worker {shard} stopped")
+
+
+worker_supervisor = WorkerSupervisor()